@@ -1,5 +1,58 @@
-"""Run the app."""
+"""Run the app, optionally recording the session or replaying one.
+
+Can also report where the startup time of the app goes instead.
+"""
+
+from argparse import ArgumentParser
+
+
+parser = ArgumentParser(
+    prog='python -m bblueleveleditor',
+    description="Bionic Blue's level editor.",
+)
+
+group = parser.add_mutually_exclusive_group()
+
+group.add_argument(
+    '--record',
+    metavar='FILE',
+    help="record the input of the session in FILE, for replaying it",
+)
+
+group.add_argument(
+    '--replay',
+    metavar='FILE',
+    help=(
+        "replay session recorded in FILE without a window and as fast"
+        " as possible, reporting the time taken by the frames and"
+        " whether the resulting level matches the recorded one"
+    ),
+)
+
+group.add_argument(
+    '--startup-times',
+    action='store_true',
+    help=(
+        "report the time taken to import the modules used by the app"
+        " and by each step of its setup, without opening a window"
+    ),
+)
+
+args = parser.parse_args()
+
+if args.startup_times:
+
+    from .startup import report_startup_times
+
+    report_startup_times()
+    raise SystemExit
+
+if args.replay is not None:
+
+    from .inputlog import replay_recording
+
+    raise SystemExit(0 if replay_recording(args.replay) else 1)
 
 from .app import run_app
 
-run_app()
+run_app(args.record)
@@ -4,23 +4,23 @@
 
 from types import SimpleNamespace
 
-from itertools import chain, repeat, product
+from itertools import chain, product
 
-from ast import literal_eval
+from collections import deque, OrderedDict
 
-from collections import deque
+from math import dist
 
-from pprint import pformat
+from time import perf_counter
 
-from math import dist
+from threading import Thread
 
-from warnings import warn
+from traceback import print_exc
 
 ### third-party imports
 
 from pygame import (
 
-    QUIT,
+    QUIT, NOEVENT,
 
     MOUSEMOTION,
     MOUSEBUTTONUP,
@@ -29,19 +29,26 @@ from pygame import (
     KEYDOWN, K_ESCAPE, K_HOME,
 
     KMOD_SHIFT,
+    KMOD_CTRL,
+
+    SRCALPHA,
 
     K_w, K_a, K_s, K_d,
 
     K_q, K_e,
 
-    K_x, K_r, K_v, K_g, K_p,
+    K_x, K_r, K_v, K_g, K_p, K_u, K_f,
 
     Rect, Surface,
     quit as quit_pygame,
 
 )
 
-from pygame.event import get as get_events
+from pygame.event import (
+    get as get_events,
+    peek as is_event_pending,
+    wait as wait_for_event,
+)
 
 from pygame.display import update
 
@@ -53,48 +60,70 @@ from pygame.mouse import get_pos as get_mouse_pos
 
 from pygame.draw import rect as draw_rect, circle as draw_circle
 
-from pygame.image import load as load_image, save as save_image
-
 from pygame.font import Font
 
 
 ### local imports
 
-from .config import (
-    FONTS_DIR,
-    NO_COLORKEY_ASSETS_DIR,
-    COLORKEY_ASSETS_DIR,
-    LEVELS_DIR,
-)
+from .config import FONTS_DIR, LEVELS_DIR, CACHE_DIR, BG_COLOR
 
 from .pygameconstants import (
     FPS,
     SCREEN,
     SCREEN_RECT,
-    BG_COLOR,
     maintain_fps,
     fill_screen,
     blit_on_screen,
-    screen_colliderect,
 )
 
-from .grid import ScrollableGrid
+from .grid import ScrollableGrid, GridOverlay
 
+from .objectstore import LAYER_NAMES
 
+from .level import Level, find_level_path
 
-### module level objs/constants
+from .assets import load_assets, new_seamless_image
+
+from .ourstdlibs.pyramidwriter import PyramidWriter
+
+from .export import ExportCache, export_tiled
+
+from .profiler import FrameProfiler
+
+from .inputlog import InputRecorder
 
-## vector representing first point where there's content
-## in the level, that is, the topleft of the topleftmost
-## object, or (0, 0) if the level is empty
-##
-## this point is used as the starting point from where to place
-## level chunks
-content_origin = Vector2()
+
+
+### time taken by each step of the app's startup after its imports, in
+### milliseconds (see startup.py)
+
+STARTUP_TIMES = {}
+
+_startup_marks = [perf_counter()]
+
+def mark_startup_step(step_name):
+    """Store time taken since last step as the time of given step."""
+
+    now = perf_counter()
+
+    STARTUP_TIMES[step_name] = (now - _startup_marks[-1]) * 1000
+    _startup_marks.append(now)
+
+
+### module level objs/constants
 
 ## vector to keep track of scrolling
+##
+## objects and chunks keep their positions in the level (unscrolled
+## positions) and this vector is used as an offset when drawing them
+## on the screen; that is, screen position = level position + scrolling
 scrolling = Vector2()
 
+## rect representing the area of the level currently visible on the
+## screen, that is, the screen rect moved by the reverse of the scrolling
+CAMERA_RECT = SCREEN_RECT.copy()
+camera_colliderect = CAMERA_RECT.colliderect
+
 ### reference unit area for placing assets
 unit_rect = Rect(0, 0, 16, 16)
 
@@ -103,6 +132,11 @@ unit_rect = Rect(0, 0, 16, 16)
 unit_grid   = ScrollableGrid(SCREEN, 1, (255,255,255), unit_rect, area_rect=SCREEN_RECT)
 screen_grid = ScrollableGrid(SCREEN, 1, (0,0,0), SCREEN_RECT, area_rect=SCREEN_RECT)
 
+## both grids pre-rendered in a single overlay
+grid_overlay = GridOverlay(SCREEN, (unit_grid, screen_grid), area_rect=SCREEN_RECT)
+
+mark_startup_step('grids')
+
 
 ### define a vicinity rect
 ###
@@ -110,7 +144,9 @@ screen_grid = ScrollableGrid(SCREEN, 1, (0,0,0), SCREEN_RECT, area_rect=SCREEN_R
 ### directions by its own dimensions, centered on the screen
 ###
 ### it is used to detect chunks of the level adjacent to the screen
-### (the screen is the visible area)
+### (the screen is the visible area); since chunks don't move when
+### scrolling, it is kept centered on the CAMERA_RECT rather than on
+### the screen
 ###   _________________________________
 ###  |                ^                |
 ###  |  VICINITY      |                |
@@ -129,24 +165,24 @@ VICINITY_RECT = (
     SCREEN_RECT.inflate(SCREEN_RECT.width * 2, SCREEN_RECT.height * 2)
 )
 
-VICINITY_WIDTH, VICINITY_HEIGHT = VICINITY_RECT.size
+VICINITY_WIDTH, VICINITY_HEIGHT = VICINITY_SIZE = VICINITY_RECT.size
 vicinity_colliderect = VICINITY_RECT.colliderect
 
-CHUNKS = set()
+## cache of pre-rendered layers of chunks, that is, surfaces with all
+## objects of a layer of a chunk blit on them, so each layer of a chunk
+## can be drawn with a single blit
+##
+## it maps (chunk, layer_name) pairs to (surf, rect) pairs, where the rect
+## is the area of the level covered by the surf; it is ordered from least
+## to most recently used, so that once the memory used by the surfaces
+## exceeds the budget below, we evict the least recently used ones among
+## those whose chunks aren't in the vicinity
 
-CHUNKS_IN = set()
-CHUNKS_IN_TEMP = set()
+CHUNK_LAYER_SURFS = OrderedDict()
+CHUNK_LAYER_SURFS_BUDGET = 64 * 1024 * 1024 # bytes
 
 ### layers
 
-LAYER_NAMES = (
-    'backprops',
-    'middleprops',
-    'blocks',
-    'actors',
-)
-
-
 get_layer_from_name = {
     name: set()
     for name in LAYER_NAMES
@@ -181,18 +217,112 @@ LETTER_E = _bg
 ###
 SEAMLESS_SURFS_MAP = {}
 
+### frame profiler
+###
+### while enabled, the time spent in each phase of a frame (functions
+### timed by the profiler, some of them wrapped here) and the number of
+### blits on the screen are collected every frame, to be shown on the
+### screen and, optionally, written to a CSV file (see toggle_profiler())
+
+PROFILER = FrameProfiler()
+
+maintain_fps = PROFILER.timed('maintain_fps', maintain_fps)
+update = PROFILER.timed('update', update)
+draw_grids = PROFILER.timed('draw_grids', grid_overlay.draw)
+
+blit_on_screen = PROFILER.counted('blits', blit_on_screen)
+
+PROFILER_CSV_PATH = LEVELS_DIR / 'frame_profile.csv'
+
+## number of frames between updates of the profiler's HUD
+PROFILER_HUD_INTERVAL = 10
+
+## rows of the HUD: indentation, label and key of the mean shown
+PROFILER_HUD_ROWS = (
+    (0, 'frame', 'frame_ms'),
+    (1, 'wait', 'maintain_fps_ms'),
+    (1, 'control', 'control_ms'),
+    (2, 'scroll', 'scroll_ms'),
+    (3, 'chunks', 'update_chunks_and_layers_ms'),
+    (4, 'on screen', 'list_onscreen_objs_ms'),
+    (1, 'update app', 'update_app_ms'),
+    (1, 'draw', 'draw_ms'),
+    (2, 'objects', 'draw_objects_ms'),
+    (2, 'grids', 'draw_grids_ms'),
+    (2, 'update', 'update_ms'),
+)
+
+render_small_text = Font(str(FONTS_DIR/'minimal_5x7.ttf'), 16).render
+
+mark_startup_step('fonts')
+
 ###
 
 REFS = SimpleNamespace()
 
-REFS.draw_unit_grid = unit_grid.draw
-REFS.draw_screen_grid = screen_grid.draw
+REFS.draw_grids = draw_grids
 
 REFS.is_deleting = False
 
 REFS.mouse_pressed_routine = do_nothing
 REFS.seamless_area_drawing_routine = do_nothing
 
+REFS.chunk_layer_surfs_bytes = 0
+
+## dirty rect rendering
+##
+## when rendering in dirty rect mode, only areas of the screen that
+## changed are redrawn and passed to pygame.display.update(); such areas
+## are stored in the list below, except when the whole screen must be
+## redrawn (like after scrolling), in which case a flag is set instead
+
+DIRTY_RECTS = []
+
+REFS.must_redraw_all = True
+
+## rects occupied by the cursor-related drawings in the last frame (and the
+## surface used as the asset preview), so we can tell when they change
+REFS.last_overlay = ()
+
+## background saving
+##
+## levels are saved on a worker thread, from a snapshot of the level
+## taken when saving starts; the save_routine checks every frame whether
+## the save finished and, for a while after that, keeps showing a status
+## message on the screen
+
+REFS.save_thread = None
+REFS.save_failed = False
+REFS.must_save_again = False
+REFS.save_routine = do_nothing
+
+REFS.save_status_surf = None
+REFS.save_status_expiry = 0.0
+
+## idle mode
+##
+## when nothing would change on the screen (no events, no scrolling and
+## no mouse routine), rather than running frames the mainloop waits for
+## an event, which is kept to be handled in the next frame; the wait
+## times out now and then, so the save routine can run, if active
+
+IDLE_TIMEOUT_MSECS = 250
+
+REFS.is_scrolling = False
+REFS.waking_event = None
+
+## frame profiling (see the frame profiler section above)
+
+REFS.end_frame = do_nothing
+REFS.profiler_surf = None
+
+## input; replaced when recording or replaying it (see inputlog.py)
+
+REFS.get_mouse_pos = get_mouse_pos
+
+REFS.recorder = None
+REFS.stop_recording = do_nothing
+
 
 ## delta map for scrolling level
 
@@ -217,6 +347,10 @@ _dy_map = _dx_map.copy()
 
 abs_delta = 8
 
+## keys scrolling the level, in the order their pressed states are used
+## as keys of the delta map
+SCROLL_KEYS = (K_a, K_d, K_w, K_s)
+
 DELTA_MAP = {
 
     (x_key + y_key) : (x_value * abs_delta, y_value * abs_delta)
@@ -227,46 +361,85 @@ DELTA_MAP = {
 }
 
 ### loading surfs
+##
+## the assets are loaded from an atlas kept in the cache, which is built
+## on the first launch and rebuilt whenever the assets change, so a
+## single image is loaded regardless of the number of assets
 
-COLOR_KEY = (192, 192, 192)
+asset_data_map = load_assets(CACHE_DIR / 'atlas')
 
-asset_data_map = {}
+asset_name_deque = deque(sorted(asset_data_map))
 
-for image_path, has_transparency in chain(
-    zip(NO_COLORKEY_ASSETS_DIR.iterdir(), repeat(False)),
-    zip(COLORKEY_ASSETS_DIR.iterdir(), repeat(True)),
-):
+mark_startup_step('assets')
 
-    ###
 
-    suffix = image_path.suffix.lower()
+### level being edited (see level.py), whose objects are grouped in
+### chunks the size of the vicinity; only the level data other than the
+### objects is read here, the objects being loaded further below
 
-    if suffix != '.png':
+LEVEL = Level(
+    find_level_path(LEVELS_DIR),
+    {
+        asset_name: (
+            asset_data['pos_name'],
+            asset_data['surf'].get_size(),
+            asset_data['is_seamless'],
+        )
+        for asset_name, asset_data in asset_data_map.items()
+    },
+    VICINITY_SIZE,
+)
 
-        warn("Non-PNG image asset ignored.", RuntimeWarning)
-        continue
+level_path = LEVEL.path
 
-    layer_name, is_seamless, pos_name, _ = image_path.suffixes
+## map of level chunks, keyed by the (column, row) of the cell each chunk
+## occupies in an imaginary table of vicinity-sized cells whose topleft
+## is the content origin of the level; this allows us to find the chunks
+## in the vicinity or the chunk owning a position without visiting every
+## chunk
+CHUNKS = LEVEL.chunks
 
-    ###
-    surf = load_image(str(image_path)).convert()
+CHUNKS_IN = set()
+CHUNKS_IN_TEMP = set()
 
-    if has_transparency:
-        surf.set_colorkey(COLOR_KEY)
+## chunks whose objects were read on demand from the level file; the
+## ones that get far from the vicinity without being modified are
+## unloaded, that is, their objects are dropped from memory until they
+## get near again (see unload_far_chunks())
+LOADED_CHUNKS = LEVEL.loaded_chunks
 
-    name = image_path.name
+### journal of edits not saved in the level file yet, beside it
+JOURNAL = LEVEL.journal
 
-    asset_name = name[:name.index('.')]
+## once the journal has this many edits, the level is saved, so
+## they are folded into the level file and dropped from the journal
+JOURNAL_COMPACTION_THRESHOLD = 1000
 
-    asset_data_map[asset_name] = {
-        'name' : asset_name,
-        'layer_name' : layer_name[1:],
-        'pos_name': pos_name[1:],
-        'is_seamless': literal_eval(is_seamless[1:]),
-        'surf' : surf,
-    }
+get_level_data = LEVEL.get_data
 
-asset_name_deque = deque(sorted(asset_data_map))
+mark_startup_step('level file')
+
+
+### object store, where all objects of the level are kept, and local
+### references to its arrays (which are only ever changed in place)
+
+STORE = LEVEL.store
+
+ASSET_SURFS = [
+    asset_data_map[asset_name]['surf']
+    for asset_name in STORE.asset_names
+]
+
+OBJ_ASSETS = STORE.assets
+OBJ_LAYERS = STORE.layers
+OBJ_SIZED = STORE.sized
+OBJ_XS = STORE.xs
+OBJ_YS = STORE.ys
+OBJ_WIDTHS = STORE.widths
+OBJ_HEIGHTS = STORE.heights
+
+get_obj_layer_name = STORE.get_layer_name
+get_obj_rect_tuple = STORE.get_rect
 
 seamless_drawing_rect = unit_rect.copy()
 
@@ -292,76 +465,16 @@ def add_seamless_asset():
     asset_name = REFS.current_asset
     pos_name = asset_data_map[asset_name]['pos_name']
 
-    scrolled_pos = getattr(union, pos_name)
+    unscrolled_union = union.move(-scrolling)
 
-    unscrolled_pos = tuple(map(int, scrolled_pos - scrolling))
+    unscrolled_pos = getattr(unscrolled_union, pos_name)
 
     layer_name = asset_data_map[asset_name]['layer_name']
 
-    layer = get_layer_from_name(layer_name)
-
-    for obj in layer:
-
-        if (
-            obj.name == asset_name
-            and obj.rect.colliderect(union)
-        ):
-            return
-
-    obj_list = (
-        level_data['layered_objects']
-        .setdefault(layer_name, [])
-    )
-
-    data = {
-        'name': asset_name,
-        'size': union.size,
-        'pos': unscrolled_pos,
-    }
-
-    obj_list.append(data)
-
-    ###
-    obj = Object2D(data, layer_name, pos_name, scrolled_pos)
-
-    ### if an existing chunk collides add obj to that chunk
-
-    for chunk in chain(CHUNKS_IN, CHUNKS):
-
-        if chunk.rect.colliderect(union):
-
-            chunk.add_obj(obj)
-            layer.add(obj)
-            break
-
-    ### otherwise create a new chunk
-
-    else:
-        
-        ## note: we don't need to add the object to the layer here,
-        ## because it will be added for us when this new chunk is added
-        ## to the set of chunks in vicinity (CHUNKS_IN) inside
-        ## update_chunks_and_layers()
-
-        chunk_anchor_pos = union.center
-        unscrolled_anchor_pos = chunk_anchor_pos - scrolling
-        pos_from_origin = unscrolled_anchor_pos - content_origin
-
-        left_multiplier = pos_from_origin.x // VICINITY_WIDTH
-        top_multiplier = pos_from_origin.y // VICINITY_HEIGHT
-
-        left = left_multiplier * VICINITY_WIDTH
-        top = top_multiplier * VICINITY_HEIGHT
-
-        VICINITY_RECT.topleft = (
-            (left, top)
-            + scrolling
-            + content_origin
-        )
-
-        CHUNKS.add(LevelChunk(VICINITY_RECT, {obj}))
+    if STORE.has_colliding_obj(asset_name, layer_name, unscrolled_union):
+        return
 
-        VICINITY_RECT.center = SCREEN_RECT.center
+    add_obj_to_level(asset_name, layer_name, unscrolled_pos, union.size)
 
     update_chunks_and_layers()
 
@@ -371,77 +484,14 @@ def add_asset():
     asset_name = REFS.current_asset
     pos_name = asset_data_map[asset_name]['pos_name']
 
-    scrolled_pos = getattr(unit_rect, pos_name)
-
-    unscrolled_pos = tuple(map(int, scrolled_pos - scrolling))
+    unscrolled_pos = getattr(unit_rect.move(-scrolling), pos_name)
 
     layer_name = asset_data_map[asset_name]['layer_name']
 
-    obj_list = level_data['layered_objects'].setdefault(layer_name, [])
-
-    for obj_data in obj_list:
-
-        if (
-            obj_data['pos'] == unscrolled_pos
-            and obj_data['name'] == asset_name
-        ):
-            return
-
-    data = {
-        'name': asset_name,
-        'pos': unscrolled_pos,
-    }
-
-    obj_list.append(data)
-
-    ###
-
-    obj = Object2D(data, layer_name, pos_name, scrolled_pos)
-
-    ###
-
-    layer = get_layer_from_name(layer_name)
-
-    ### if an existing chunk collides add obj to that chunk
-
-    rect = obj.rect
-
-    for chunk in chain(CHUNKS_IN, CHUNKS):
-
-        if chunk.rect.colliderect(rect):
-
-            chunk.add_obj(obj)
-            layer.add(obj)
-            break
-
-    ### otherwise create a new chunk
-
-    else:
-
-        ## note: we don't need to add the object to the layer here,
-        ## because it will be added for us when this new chunk is added
-        ## to the set of chunks in vicinity (CHUNKS_IN) inside
-        ## update_chunks_and_layers()
-
-        chunk_anchor_pos = rect.center
-        unscrolled_anchor_pos = chunk_anchor_pos - scrolling
-        pos_from_origin = unscrolled_anchor_pos - content_origin
+    if STORE.has_obj_at(asset_name, layer_name, unscrolled_pos):
+        return
 
-        left_multiplier = pos_from_origin.x // VICINITY_WIDTH
-        top_multiplier = pos_from_origin.y // VICINITY_HEIGHT
-
-        left = left_multiplier * VICINITY_WIDTH
-        top = top_multiplier * VICINITY_HEIGHT
-
-        VICINITY_RECT.topleft = (
-            (left, top)
-            + scrolling
-            + content_origin
-        )
-
-        CHUNKS.add(LevelChunk(VICINITY_RECT, {obj}))
-
-        VICINITY_RECT.center = SCREEN_RECT.center
+    add_obj_to_level(asset_name, layer_name, unscrolled_pos)
 
     update_chunks_and_layers()
 
@@ -452,70 +502,38 @@ def stop_adding_assets():
     REFS.mouse_pressed_routine = do_nothing
 
 
-class Object2D:
-
-    def __init__(self, data, layer_name, pos_name, pos):
-
-        self.data = data
-        self.layer_name = layer_name
-
-        name = self.name = data['name']
-
-        if 'size' in data:
-
-            size = data['size']
-            key = name, size
-
-            try:
-                self.image = SEAMLESS_SURFS_MAP[key]
+def get_obj_rect(obj_id):
+    return Rect(get_obj_rect_tuple(obj_id))
 
-            except KeyError:
+def get_obj_image(obj_id):
+    """Return image of object, creating it if it is a seamless one."""
 
-                unit_surf = asset_data_map[name]['surf']
-
-                image = new_seamless_image(unit_surf, size)
-                self.image = SEAMLESS_SURFS_MAP[key] = image
-
-        else:
-            self.image = asset_data_map[name]['surf']
-
-        self.rect = self.image.get_rect()
-
-        setattr(self.rect, pos_name, pos)
-
-    def draw(self):
-        blit_on_screen(self.image, self.rect)
-
-    def draw_outlined(self):
-        self.draw()
-        draw_rect(SCREEN, 'black', self.rect, 1)
-
-def new_seamless_image(surf, size):
-
-    rect = surf.get_rect()
-    area = Rect(0, 0, *size)
-
-    area_surf = Surface(size).convert()
-
-    if surf.get_colorkey():
+    return get_record_image(
+        OBJ_ASSETS[obj_id],
+        OBJ_SIZED[obj_id],
+        OBJ_WIDTHS[obj_id],
+        OBJ_HEIGHTS[obj_id],
+    )
 
-        area_surf.fill(COLOR_KEY)
-        area_surf.set_colorkey(COLOR_KEY)
+def get_record_image(asset_id, has_size, width, height):
+    """Return image of object with given data, as in its record."""
 
-    blit_on_area = area_surf.blit
+    if has_size:
 
-    while rect.top < area.bottom:
+        key = asset_id, width, height
 
-        blit_on_area(surf, rect)
+        try:
+            return SEAMLESS_SURFS_MAP[key]
 
-        rect.left = rect.right
+        except KeyError:
 
-        if rect.left > area.right:
+            image = SEAMLESS_SURFS_MAP[key] = (
+                new_seamless_image(ASSET_SURFS[asset_id], key[1:])
+            )
 
-            rect.top = rect.bottom
-            rect.left = 0
+            return image
 
-    return area_surf
+    return ASSET_SURFS[asset_id]
 
 
 def update_asset_refs():
@@ -547,34 +565,35 @@ def finish_deleting_assets():
 
 def delete_asset():
 
-    mouse_pos = get_mouse_pos()
-
-    for_deletion = []
+    mouse_x, mouse_y = map(int, REFS.get_mouse_pos() - scrolling)
 
-    for on_screen_layer in ONSCREEN_LAYERS:
+    ### query the objects under the mouse from the point index of each
+    ### chunk in the vicinity (objects on the screen always belong to
+    ### those chunks)
 
-        for obj in on_screen_layer:
+    for_deletion = [
 
-            if obj.rect.collidepoint(mouse_pos):
-                for_deletion.append((on_screen_layer, obj))
+        (chunk, obj_id)
 
-    if not for_deletion: return
+        for chunk in CHUNKS_IN
+        for obj_id in chunk.get_objs_at(mouse_x, mouse_y)
 
-    layered_objects = level_data['layered_objects']
+    ]
 
-    for on_screen_layer, obj in for_deletion:
+    for chunk, obj_id in for_deletion:
 
         ### remove object from live layers
 
-        on_screen_layer.remove(obj)
-        layer = get_layer_from_name(obj.layer_name)
-        layer.remove(obj)
+        layer_id = OBJ_LAYERS[obj_id]
+
+        ONSCREEN_LAYERS[layer_id].discard(obj_id)
+        LAYERS[layer_id].remove(obj_id)
 
-        ### remove object from chunk
-        obj.chunk.remove_obj(obj)
+        ### remove object from chunk and level
+        LEVEL.remove(chunk, obj_id)
 
-        ### remove object's data from level data
-        layered_objects[obj.layer_name].remove(obj.data)
+    if for_deletion:
+        check_journal_size()
 
 def toggle_eraser():
 
@@ -589,226 +608,330 @@ def toggle_eraser():
         update_asset_refs()
 
 
-### loading/creating level data
+### level chunks
+###
+### the level notifies us whenever a chunk is edited or unloaded (so we
+### can update what is drawn) and whenever its object store is compacted
+### (so we can update the ids of the objects we reference)
+
+def on_chunk_edit(chunk, layer_name, obj_id):
+    """Discard pre-rendered layer of chunk, marking object area dirty."""
 
-try:
+    discard_chunk_layer_surf(chunk, layer_name)
+    DIRTY_RECTS.append(get_obj_rect(obj_id).move(scrolling))
 
-    level_path = next(
-        path
-        for path in LEVELS_DIR.iterdir()
-        if path.suffix == '.lvl'
-    )
+def on_chunk_unload(chunk):
+    """Discard pre-rendered layers of chunk."""
+
+    for layer_name in LAYER_NAMES:
+        discard_chunk_layer_surf(chunk, layer_name)
 
-except StopIteration:
+def on_objects_compaction(remap):
+    """Update ids of objects in the layers, after the store compaction."""
 
-    level_path = LEVELS_DIR / 'level.lvl'
+    for obj_ids in chain(LAYERS, ONSCREEN_LAYERS):
 
-    level_data = {
-      'layered_objects': {}
-    }
+        new_ids = [remap[obj_id] for obj_id in obj_ids]
+        obj_ids.clear()
+        obj_ids.update(new_ids)
 
-else:
-    level_data = literal_eval(level_path.read_text(encoding='utf-8'))
+LEVEL.on_edit = on_chunk_edit
+LEVEL.on_unload = on_chunk_unload
+LEVEL.on_compact = on_objects_compaction
 
+def get_chunk_layer_surf(chunk, layer_name):
+    """Return (surf, rect) with objects of layer of chunk pre-rendered.
 
+    The surf is created lazily and cached in CHUNK_LAYER_SURFS.
+    If the layer has no objects, None is returned instead.
+    """
+    key = chunk, layer_name
 
-class LevelChunk:
+    try:
+        item = CHUNK_LAYER_SURFS[key]
 
-    def __init__(self, rect, objs):
+    except KeyError:
 
-        ### instantiate rect
-        self.rect = rect.copy()
+        objs = getattr(chunk, layer_name)
 
-        ### store objs
-        self.objs = objs
+        if not objs:
+            return None
 
-        ### create and store layers
+        item = CHUNK_LAYER_SURFS[key] = render_objs(objs)
 
-        for layer_name in LAYER_NAMES:
-            setattr(self, layer_name, set())
+        surf, _ = item
+        REFS.chunk_layer_surfs_bytes += get_surf_bytes(surf)
 
-        ### create and store center map, a map to store the
-        ### center of each object relative to this chunk's topleft
-        ###
-        ### also create a local reference to it and an attribute
-        ### referencing its item getter method
+        if REFS.chunk_layer_surfs_bytes > CHUNK_LAYER_SURFS_BUDGET:
+            evict_chunk_layer_surfs()
 
-        center_map = self.center_map = {}
-        self.get_center = center_map.__getitem__
+    else:
+        CHUNK_LAYER_SURFS.move_to_end(key)
 
-        ### iterate over objects...
-        ###
-        ### - storing them in layers
-        ### - storing objects centers relative to level's topleft
+    return item
 
-        topleft = self.rect.topleft
+def discard_chunk_layer_surf(chunk, layer_name):
 
-        for obj in objs:
+    item = CHUNK_LAYER_SURFS.pop((chunk, layer_name), None)
 
-            obj.chunk = self
+    if item is not None:
 
-            getattr(self, obj.layer_name).add(obj)
+        surf, _ = item
+        REFS.chunk_layer_surfs_bytes -= get_surf_bytes(surf)
 
-            center_map[obj] = tuple(
-                chunk_pos - obj_center_pos
-                for chunk_pos, obj_center_pos in zip(topleft, obj.rect.center)
-            )
+def render_objs(obj_ids):
+    """Return (surf, rect) pair with given objects blit on surf.
 
-    def position_objs(self):
+    The surf has per-pixel alpha, is transparent wherever there are
+    no objects and covers the area of the level represented by the rect,
+    that is, the union of the objects' rects.
+    """
+    first_id, *other_ids = obj_ids
 
-        get_center = self.get_center
+    rect = get_obj_rect(first_id).unionall(
+        [get_obj_rect_tuple(obj_id) for obj_id in other_ids]
+    )
 
-        topleft = self.rect.topleft
+    surf = Surface(rect.size, SRCALPHA)
 
-        for obj in self.objs:
+    offset_x, offset_y = -rect.x, -rect.y
 
-            obj.rect.center = tuple(
-                chunk_pos - obj_center_offset
-                for chunk_pos, obj_center_offset in zip(topleft, get_center(obj))
+    surf.blits(
+        [
+            (
+                get_obj_image(obj_id),
+                (OBJ_XS[obj_id] + offset_x, OBJ_YS[obj_id] + offset_y),
             )
+            for obj_id in obj_ids
+        ],
+        False,
+    )
 
-    def add_obj(self, obj):
+    return surf, rect
 
-        obj.chunk = self
+def get_surf_bytes(surf):
+    return surf.get_pitch() * surf.get_height()
 
-        self.objs.add(obj)
+def evict_chunk_layer_surfs():
+    """Evict least recently used surfs until we are within budget.
 
-        getattr(self, obj.layer_name).add(obj)
+    Only surfs of chunks outside the vicinity are evicted.
+    """
+    for key in [
+        key
+        for key in CHUNK_LAYER_SURFS
+        if key[0] not in CHUNKS_IN
+    ]:
 
-        self.center_map[obj] = tuple(
-            chunk_pos - obj_center_pos
-            for chunk_pos, obj_center_pos in zip(self.rect.topleft, obj.rect.center)
-        )
+        if REFS.chunk_layer_surfs_bytes <= CHUNK_LAYER_SURFS_BUDGET:
+            break
+
+        surf, _ = CHUNK_LAYER_SURFS.pop(key)
+        REFS.chunk_layer_surfs_bytes -= get_surf_bytes(surf)
+
+
+def add_obj_to_level(asset_name, layer_name, pos, size=None):
+    """Add object to level, listing it if its chunk is in the vicinity.
 
-    def remove_obj(self, obj):
+    Objects added to a new chunk are listed once the chunk enters the
+    vicinity (see update_chunks_and_layers()).
+    """
+    obj_id, chunk = LEVEL.add(asset_name, layer_name, pos, size)
 
-        self.objs.remove(obj)
-        getattr(self, obj.layer_name).remove(obj)
-        self.center_map.pop(obj)
+    if chunk in CHUNKS_IN:
+        get_layer_from_name(layer_name).add(obj_id)
 
+    check_journal_size()
+
+def check_journal_size():
+    """Start saving the level if the journal got too big."""
+
+    if (
+        JOURNAL.count >= JOURNAL_COMPACTION_THRESHOLD
+        and REFS.save_thread is None
+    ):
+        save_level()
 
 def instantiate_and_group_objects():
+    """Store objects from level data and group them in level chunks.
+
+    If the level is a .lvlb file with vicinity-sized chunks, only its
+    chunk index is read, the objects being read on demand.
+    """
+    start = perf_counter()
 
-    layered_objects = level_data['layered_objects']
+    LEVEL.load_objects()
 
-    ### instantiate all objects
+    ### report
 
-    objs = [
+    ms = (perf_counter() - start) * 1000
 
-        Object2D(
-            obj_data,
-            layer_name,
-            asset_data_map[obj_data['name']]['pos_name'],
-            obj_data['pos']
+    if LEVEL.reader is None:
+
+        print(
+            f"Loaded {len(STORE)} objects into {len(CHUNKS)} chunks"
+            f" in {ms:.1f} ms."
         )
 
-        for layer_name, objs in layered_objects.items()
-        for obj_data in objs
+    else:
 
-    ]
+        print(
+            f"Indexed {len(CHUNKS)} chunks in {ms:.1f} ms;"
+            " their objects are loaded as they get near."
+        )
 
-    n = len(objs)
+def replay_journal():
+    """Reapply edits from the journal on top of the loaded level."""
 
-    if n == 1:
+    edit_count = LEVEL.replay_journal()
 
-        obj = objs[0]
+    if edit_count:
 
-        VICINITY_RECT.topleft = obj.topleft
-        content_origin.update(obj.topleft)
+        print(
+            f"Replayed {edit_count} unsaved edits"
+            f" from {JOURNAL.filepath.name}."
+        )
 
-        CHUNKS.add(LevelChunk(VICINITY_RECT, objs))
+instantiate_and_group_objects()
+mark_startup_step('level objects')
 
-    elif n > 1:
+replay_journal()
+mark_startup_step('journal replay')
 
-        ### XXX idea, not sure if worth pursuing (certainly not now,
-        ### probably never): make it so assets that collide with more than
-        ### one chunk are added to the one that gets more area after cliping
-        ### the asset's rect with the chunk's rect
+###
 
-        ## define a union rect
+def run_app(recording_path=None):
+    """Run the app's mainloop.
 
-        first_obj, *other_objs = objs
+    If recording_path is given, the input of the session is recorded
+    in a file there (see inputlog.py).
+    """
+    if recording_path is not None:
+        start_recording(recording_path)
 
-        union_rect = first_obj.rect.unionall(
+    init_view()
 
-            [
-                obj.rect
-                for obj in other_objs
-            ]
+    while True:
 
-        )
+        maintain_fps(FPS)
 
-        content_origin.update(union_rect.topleft)
+        control()
+        update_app()
+        REFS.draw()
 
-        ## prepare to loop while evaluating whether objects
-        ## and the union rect collide with the vicinity
+        REFS.end_frame()
 
-        union_left, _ = VICINITY_RECT.topleft = union_rect.topleft
+        if is_idle():
+            wait_while_idle()
 
-        obj_set = set(objs)
 
-        ## while looping indefinitely
+def init_view():
+    """Center vicinity on camera, listing chunks and objects in it."""
 
-        while True:
+    VICINITY_RECT.center = CAMERA_RECT.center
+    update_chunks_and_layers()
 
-            ## if there are objs colliding with the vicinity,
-            ## store them in their own level chunk and remove
-            ## them from the set of objects
+def is_idle():
+    """Return whether the app can wait for events rather than run frames.
+
+    The profiler, when enabled, keeps the app running frames, since it
+    measures them.
+    """
+    return not (
+        REFS.is_scrolling
+        or REFS.mouse_pressed_routine is not do_nothing
+        or PROFILER.is_enabled
+        or is_event_pending()
+    )
 
-            colliding_objs = {
-                obj
-                for obj in obj_set
-                if vicinity_colliderect(obj.rect)
-            }
+def wait_while_idle():
+    """Wait for an event, keeping it for the next frame.
 
-            if colliding_objs:
+    Also stops waiting if the save routine is active, so it runs now
+    and then.
+    """
+    while True:
 
-                obj_set -= colliding_objs
-                CHUNKS.add(LevelChunk(VICINITY_RECT, colliding_objs))
+        event = wait_for_event(IDLE_TIMEOUT_MSECS)
 
-            ## if there's no obj left in the set, break out of loop
+        if event.type != NOEVENT:
 
-            if not obj_set:
-                break
+            REFS.waking_event = event
+            break
 
-            ## reposition vicinity horizontally, as though the union
-            ## rect was a table and we were moving the vicinity to the
-            ## column to the right
-            VICINITY_RECT.x += VICINITY_WIDTH
+        if REFS.save_routine is not do_nothing:
+            break
 
-            ## if vicinity in new position doesn't touch the union
-            ## anymore, keep thinking of the union rect as a table and
-            ## reposition the vicinity at the beginning of the next
-            ## imaginary row
+def get_inputs():
+    """Return events and pressed states of scrolling keys (a, d, w, s)."""
 
-            if not vicinity_colliderect(union_rect):
+    events = get_events()
+    pressed_states = get_pressed_states()
 
-                VICINITY_RECT.left = union_left
-                VICINITY_RECT.y += VICINITY_HEIGHT
+    ### include the event that ended the last wait, if any
 
-instantiate_and_group_objects()
+    if REFS.waking_event is not None:
 
-###
+        events.insert(0, REFS.waking_event)
+        REFS.waking_event = None
 
-def run_app():
-    """Run the app's mainloop."""
+    return events, tuple(pressed_states[key] for key in SCROLL_KEYS)
 
-    VICINITY_RECT.center = SCREEN_RECT.center
+REFS.get_inputs = get_inputs
 
-    update_chunks_and_layers()
+def start_recording(recording_path):
+    """Start recording input of each frame in file at given path."""
 
-    while True:
+    REFS.recorder = InputRecorder(
+        recording_path,
+        level_path,
+        JOURNAL.filepath,
+    )
 
-        maintain_fps(FPS)
+    REFS.get_inputs = get_recorded_inputs
+    REFS.stop_recording = stop_recording
 
-        control()
-        update_app()
-        draw()
+def get_recorded_inputs():
+    """Return input of frame, like get_inputs(), recording it."""
+
+    events, scroll_states = get_inputs()
+
+    REFS.recorder.write_frame(events, scroll_states, get_mouse_pos())
+
+    return events, scroll_states
+
+def stop_recording():
+    """Finish recording with digest of resulting level data."""
+
+    REFS.recorder.close(get_level_data())
+
+    REFS.recorder = None
+    REFS.get_inputs = get_inputs
+    REFS.stop_recording = do_nothing
+
+def quit_app():
+
+    wait_for_saving()
+
+    PROFILER.disable()
+    REFS.stop_recording()
 
+    quit_pygame()
+    quit()
 
+@PROFILER.timed('control')
 def control():
 
-    for event in get_events():
+    events, scroll_states = REFS.get_inputs()
+
+    ### the unit rect follows the current mouse position, so it only
+    ### needs to be updated once, regardless of how many times the mouse
+    ### moved since the last frame
+
+    if any(event.type == MOUSEMOTION for event in events):
+        update_unit_rect_topleft()
+
+    for event in events:
 
         if event.type == MOUSEBUTTONDOWN:
 
@@ -820,9 +943,6 @@ def control():
             if event.button == 1:
                 REFS.on_mouse_release()
 
-        elif event.type == MOUSEMOTION:
-            update_unit_rect_topleft()
-
         elif event.type == KEYDOWN:
 
             if event.key in (K_q, K_e):
@@ -849,56 +969,154 @@ def control():
                     else normal_draw_objects
                 )
 
-            elif event.key == K_g:
+                REFS.must_redraw_all = True
 
-                if REFS.draw_unit_grid == do_nothing:
+            elif event.key == K_u:
 
-                    REFS.draw_unit_grid = unit_grid.draw
-                    REFS.draw_screen_grid = screen_grid.draw
+                REFS.draw = (
+                    dirty_draw
+                    if REFS.draw == draw
+                    else draw
+                )
 
-                else:
+                REFS.must_redraw_all = True
 
-                    REFS.draw_unit_grid = do_nothing
-                    REFS.draw_screen_grid = do_nothing
+            elif event.key == K_g:
+
+                REFS.draw_grids = (
+                    draw_grids
+                    if REFS.draw_grids == do_nothing
+                    else do_nothing
+                )
+
+                REFS.must_redraw_all = True
 
             elif event.key == K_v:
-                level_path.write_text(pformat(level_data), encoding='utf-8')
+                save_level()
 
             elif event.key == K_p:
 
                 must_outline_chunks = event.mod & KMOD_SHIFT
-                save_level_as_png(must_outline_chunks)
+                must_build_pyramid = event.mod & KMOD_CTRL
 
-            elif event.key == K_ESCAPE:
+                save_level_as_png(must_outline_chunks, must_build_pyramid)
 
-                quit_pygame()
-                quit()
+            elif event.key == K_f:
+                toggle_profiler(event.mod & KMOD_SHIFT)
 
-        elif event.type == QUIT:
+            elif event.key == K_ESCAPE:
+                quit_app()
 
-            quit_pygame()
-            quit()
+        elif event.type == QUIT:
+            quit_app()
 
     ###
 
-    pressed_states = get_pressed_states()
-
-    dx, dy = DELTA_MAP[
+    dx, dy = DELTA_MAP[scroll_states]
 
-        pressed_states[K_a],
-        pressed_states[K_d],
-        pressed_states[K_w],
-        pressed_states[K_s],
+    REFS.is_scrolling = bool(dx or dy)
 
-    ]
-
-    if dx or dy:
+    if REFS.is_scrolling:
         scroll(dx, dy)
 
+@PROFILER.timed('update_app')
 def update_app():
     REFS.mouse_pressed_routine()
+    REFS.save_routine()
 
+@PROFILER.timed('draw')
 def draw():
+    """Redraw the whole screen and update the display."""
+
+    draw_scene()
+    update()
+
+    ### since everything was redrawn, there's no pending changes
+
+    DIRTY_RECTS.clear()
+    REFS.must_redraw_all = False
+
+@PROFILER.timed('draw')
+def dirty_draw():
+    """Redraw and update only areas of the screen which changed.
+
+    If nothing changed, nothing is drawn at all.
+    """
+
+    ### if the cursor-related drawings changed, both their previous and
+    ### current areas must be redrawn
+
+    overlay = get_overlay()
+
+    if overlay != REFS.last_overlay:
+
+        for item in chain(REFS.last_overlay, overlay):
+
+            if type(item) is Rect:
+                DIRTY_RECTS.append(item)
+
+        REFS.last_overlay = overlay
+
+    ###
+
+    if REFS.must_redraw_all:
+        draw()
+
+    elif DIRTY_RECTS:
+
+        ## redraw only within the union of the changed areas
+
+        area = DIRTY_RECTS[0].unionall(DIRTY_RECTS).clip(SCREEN_RECT)
+
+        SCREEN.set_clip(area)
+        draw_scene()
+        SCREEN.set_clip(None)
+
+        ## update only the changed areas
+
+        update(DIRTY_RECTS)
+        DIRTY_RECTS.clear()
+
+def get_overlay():
+    """Return surface and rects of cursor-related drawings."""
+
+    asset_surf = REFS.asset_surf
+
+    overlay = [
+        asset_surf,
+        asset_surf.get_rect(topleft=get_asset_preview_pos()),
+        unit_rect.copy(),
+        Rect(0, 0, 11, 11),
+    ]
+
+    overlay[3].center = getattr(
+        unit_rect,
+        asset_data_map[REFS.current_asset]['pos_name'],
+    )
+
+    if REFS.seamless_area_drawing_routine == draw_seamless_area:
+        overlay.append(unit_rect.union(seamless_drawing_rect))
+
+    if REFS.save_status_surf is not None:
+
+        overlay.extend((
+            REFS.save_status_surf,
+            get_save_status_rect(),
+        ))
+
+    if REFS.profiler_surf is not None:
+
+        overlay.extend((
+            REFS.profiler_surf,
+            REFS.profiler_surf.get_rect(topleft=(5, 5)),
+        ))
+
+    return overlay
+
+def get_asset_preview_pos():
+    return tuple(v + 6 for v in REFS.get_mouse_pos())
+
+def draw_scene():
 
     fill_screen(BG_COLOR)
 
@@ -906,12 +1124,11 @@ def draw():
 
     REFS.seamless_area_drawing_routine()
 
-    REFS.draw_unit_grid()
-    REFS.draw_screen_grid()
+    REFS.draw_grids()
 
     asset_data = asset_data_map[REFS.current_asset]
 
-    blit_on_screen(REFS.asset_surf, tuple(v + 6 for v in get_mouse_pos()))
+    blit_on_screen(REFS.asset_surf, get_asset_preview_pos())
 
     draw_rect(SCREEN, 'blue', unit_rect, 1)
 
@@ -922,7 +1139,18 @@ def draw():
         4,
     )
 
-    update()
+    if REFS.save_status_surf is not None:
+        blit_on_screen(REFS.save_status_surf, get_save_status_rect())
+
+    if REFS.profiler_surf is not None:
+        blit_on_screen(REFS.profiler_surf, (5, 5))
+
+def get_save_status_rect():
+    return REFS.save_status_surf.get_rect(
+        bottomleft=SCREEN_RECT.move(5, -5).bottomleft
+    )
+
+REFS.draw = draw
 
 ###
 
@@ -933,7 +1161,7 @@ def update_unit_rect_topleft():
     h_scrolling_rest = horiz_scrolling % 16
     v_scrolling_rest = vert_scrolling % 16
 
-    mx, my = get_mouse_pos()
+    mx, my = REFS.get_mouse_pos()
 
     x_rest = (mx - h_scrolling_rest) % 16
     y_rest = (my - v_scrolling_rest) % 16
@@ -943,6 +1171,7 @@ def update_unit_rect_topleft():
 
     unit_rect.topleft = x, y
 
+@PROFILER.timed('scroll')
 def scroll(dx, dy):
 
     unit_grid.scroll(dx, dy)
@@ -950,26 +1179,36 @@ def scroll(dx, dy):
 
     seamless_drawing_rect.move_ip(dx, dy)
 
-    for chunk in CHUNKS:
-        chunk.rect.move_ip(dx, dy)
+    scrolling.x += dx
+    scrolling.y += dy
+
+    REFS.must_redraw_all = True
+
+    CAMERA_RECT.move_ip(-dx, -dy)
+    VICINITY_RECT.center = CAMERA_RECT.center
 
     ###
     update_chunks_and_layers()
     ###
 
-    scrolling.x += dx
-    scrolling.y += dy
-
     update_unit_rect_topleft()
 
+@PROFILER.timed('update_chunks_and_layers')
 def update_chunks_and_layers():
 
-    ### check current chunks in vicinity
+    ### check current chunks in vicinity by looking up the cells
+    ### touching it
+
+    get_chunk = CHUNKS.get
 
     CHUNKS_IN_TEMP.update(
+
         chunk
-        for chunk in CHUNKS
-        if vicinity_colliderect(chunk.rect)
+
+        for chunk in map(get_chunk, LEVEL.get_cells_touching(VICINITY_RECT))
+
+        if chunk is not None
+
     )
 
     ### if it is different from previous chunks in vicinity...
@@ -988,10 +1227,14 @@ def update_chunks_and_layers():
                 )
 
 
-        ### for the chunks entering vicinity, add their objects to the layers
+        ### for the chunks entering vicinity, add their objects to the
+        ### layers, reading them from the level file first if needed
 
         for chunk in (CHUNKS_IN_TEMP - CHUNKS_IN):
 
+            if not chunk.is_loaded:
+                chunk.load()
+
             for layer_name in LAYER_NAMES:
 
                 get_layer_from_name(layer_name).update(
@@ -1004,90 +1247,358 @@ def update_chunks_and_layers():
         CHUNKS_IN.clear()
         CHUNKS_IN.update(CHUNKS_IN_TEMP)
 
-    ### for each chunk in vicinity, reposition their objects
-
-    for chunk in CHUNKS_IN:
-        chunk.position_objs()
+        ### unload chunks far from vicinity
+        unload_far_chunks()
 
     ### clear temporary chunks collection
     CHUNKS_IN_TEMP.clear()
 
-    ### list objects on screen
+    ###
+    list_onscreen_objs()
+
+@PROFILER.timed('list_onscreen_objs')
+def list_onscreen_objs():
+    """List objects on screen in each layer.
+
+    That is, objects of chunks in vicinity whose rects overlap the area
+    seen by the camera.
+    """
+    left, top, right, bottom = (
+        CAMERA_RECT.left,
+        CAMERA_RECT.top,
+        CAMERA_RECT.right,
+        CAMERA_RECT.bottom,
+    )
 
     for layer, on_screen in zip(LAYERS, ONSCREEN_LAYERS):
 
         on_screen.clear()
 
         on_screen.update(
-            obj
-            for obj in layer
-            if screen_colliderect(obj.rect)
+
+            obj_id
+
+            for obj_id in layer
+
+            if (
+                OBJ_XS[obj_id] < right
+                and OBJ_XS[obj_id] + OBJ_WIDTHS[obj_id] > left
+                and OBJ_YS[obj_id] < bottom
+                and OBJ_YS[obj_id] + OBJ_HEIGHTS[obj_id] > top
+            )
+
         )
 
+def unload_far_chunks():
+    """Unload unmodified chunks more than a chunk away from vicinity.
+
+    Keeping chunks right around the vicinity loaded avoids reading them
+    over and over when scrolling back and forth near their edges.
+    Modified chunks are kept until saved, since their objects aren't
+    in the level file.
+
+    The object store is also compacted here when needed (see
+    Level.unload_chunks_outside()).
+    """
+    LEVEL.unload_chunks_outside(
+        VICINITY_RECT.inflate(VICINITY_WIDTH * 2, VICINITY_HEIGHT * 2)
+    )
+
+@PROFILER.timed('draw_objects')
 def normal_draw_objects():
+    """Draw pre-rendered layers of chunks in vicinity, layer by layer."""
 
-    for on_screen_layer in ONSCREEN_LAYERS:
-        for prop in on_screen_layer:
-            prop.draw()
+    offset = scrolling
+
+    for layer_name in LAYER_NAMES:
+
+        for chunk in CHUNKS_IN:
+
+            item = get_chunk_layer_surf(chunk, layer_name)
+
+            if item is None:
+                continue
+
+            surf, rect = item
 
+            if camera_colliderect(rect):
+                blit_on_screen(surf, rect.move(offset))
+
+@PROFILER.timed('draw_objects')
 def outline_draw_objects():
 
+    offset = scrolling
+
     for on_screen_layer in ONSCREEN_LAYERS:
-        for prop in on_screen_layer:
-            prop.draw_outlined()
+
+        for obj_id in on_screen_layer:
+
+            rect = get_obj_rect(obj_id).move(offset)
+
+            blit_on_screen(get_obj_image(obj_id), rect)
+            draw_rect(SCREEN, 'black', rect, 1)
 
 
 REFS.draw_objects = normal_draw_objects
 
-def save_level_as_png(must_outline_chunks):
+def save_level():
+    """Start saving level on a worker thread.
 
-    ### position objs relative to their chunks
+    The level is snapshotted here, so edits made while saving don't
+    affect the data being saved (see Level.begin_save()).
 
-    for chunk in CHUNKS:
-        chunk.position_objs()
+    If a previous save is still in progress, a new one is started
+    once it finishes.
+    """
+    if REFS.save_thread is not None:
 
-    ### create rect union from them
+        REFS.must_save_again = True
+        return
 
-    one, *rest = (
-        obj
-        for chunk in CHUNKS
-        for obj in chunk.objs
+    REFS.must_save_again = False
+
+    write_level, args = LEVEL.begin_save()
+
+    ### start saving
+
+    REFS.save_failed = False
+
+    REFS.save_thread = Thread(
+        target=run_save,
+        args=(write_level, args),
+        daemon=True,
+    )
+
+    REFS.save_thread.start()
+
+    set_save_status('saving...', 0)
+    REFS.save_routine = check_saving
+
+def run_save(write_level, args):
+    """Write level, flagging failure (run on worker thread)."""
+
+    try:
+        write_level(*args)
+
+    except Exception:
+
+        print_exc()
+        REFS.save_failed = True
+
+def check_saving():
+    """Finish saving if worker thread is done."""
+
+    if not REFS.save_thread.is_alive():
+        finish_saving()
+
+def wait_for_saving():
+    """Wait for saves in progress, if any, and finish them."""
+
+    while REFS.save_thread is not None:
+
+        REFS.save_thread.join()
+        finish_saving()
+
+def finish_saving():
+    """Finish save whose worker thread is done (see Level.end_save())."""
+
+    REFS.save_thread = None
+
+    if REFS.save_failed:
+
+        LEVEL.abort_save()
+
+        set_save_status('save failed', 4)
+        return
+
+    LEVEL.end_save()
+
+    set_save_status('saved', 2)
+
+    if REFS.must_save_again:
+        save_level()
+
+def set_save_status(text, duration):
+    """Show save status text on the screen for duration seconds.
+
+    A duration of 0 means the text is shown until replaced.
+    """
+    REFS.save_status_surf = (
+        render_text(text, False, 'black', 'white').convert()
+    )
+
+    REFS.save_status_expiry = perf_counter() + duration if duration else 0.0
+
+    REFS.save_routine = expire_save_status if duration else do_nothing
+
+def expire_save_status():
+    """Hide save status text once it expires."""
+
+    if perf_counter() >= REFS.save_status_expiry:
+
+        REFS.save_status_surf = None
+        REFS.save_routine = do_nothing
+
+def toggle_profiler(must_write_csv):
+    """Show/hide frame profiler HUD, profiling frames while it is shown.
+
+    If must_write_csv is true when showing it, the samples of all frames
+    are also written to a CSV file, until the HUD is hidden.
+    """
+    if PROFILER.is_enabled:
+
+        PROFILER.disable()
+
+        REFS.end_frame = do_nothing
+        REFS.profiler_surf = None
+
+    else:
+
+        PROFILER.enable(PROFILER_CSV_PATH if must_write_csv else None)
+        REFS.end_frame = end_profiled_frame
+
+    REFS.must_redraw_all = True
+
+def end_profiled_frame():
+    """Store sample of frame, updating the profiler HUD now and then."""
+
+    PROFILER.end_frame(
+        chunks_in_vicinity=len(CHUNKS_IN),
+        onscreen_objects=sum(map(len, ONSCREEN_LAYERS)),
     )
 
-    union = one.rect.unionall([obj.rect for obj in rest])
+    if not PROFILER.frame_index % PROFILER_HUD_INTERVAL:
+        update_profiler_hud()
 
-    ### create surface from that rect union and fill it
+def update_profiler_hud():
+    """Render HUD with means of the most recent profiler samples."""
 
-    s = Surface(union.size).convert()
-    s.fill(BG_COLOR)
+    means = PROFILER.get_means()
 
-    ### blit objects in it, layer by layer, as we offset
-    ### their rects by the union's topleft
+    rows = [
+        (' ' * indentation + label, f'{means[key]:.1f} ms')
+        for indentation, label, key in PROFILER_HUD_ROWS
+    ]
+
+    rows.extend((
+        ('chunks in vicinity', f"{means['chunks_in_vicinity']:.0f}"),
+        ('objs on screen', f"{means['onscreen_objects']:.0f}"),
+        ('blits', f"{means['blits']:.0f}"),
+    ))
 
-    offset_x, offset_y = (-coord for coord in union.topleft)
+    if PROFILER.csv_file is not None:
+        rows.append((f'writing {PROFILER_CSV_PATH.name}', ''))
 
-    blit_on_surf = s.blit
+    ### render labels and values in two columns, values aligned to the
+    ### right
 
-    for chunk in CHUNKS:
+    row_surfs = [
+        (
+            render_small_text(label, False, 'black'),
+            render_small_text(value, False, 'black'),
+        )
+        for label, value in rows
+    ]
+
+    labels_width = max(label.get_width() for label, _ in row_surfs)
+    values_width = max(value.get_width() for _, value in row_surfs)
+
+    line_height = row_surfs[0][0].get_height()
+
+    hud = Surface(
+        (
+            labels_width + values_width + 10,
+            line_height * len(row_surfs) + 4,
+        )
+    ).convert()
 
-        for layer_name in LAYER_NAMES:
+    hud.fill('white')
 
-            for obj in getattr(chunk, layer_name):
+    right = hud.get_width() - 2
 
-                blit_on_surf(obj.image, obj.rect.move(offset_x, offset_y))
+    for index, (label, value) in enumerate(row_surfs):
 
-    ### if we must outline the chunks, draw their outlines too
+        y = 2 + index * line_height
 
-    if must_outline_chunks:
+        hud.blit(label, (2, y))
+        hud.blit(value, value.get_rect(topright=(right, y)))
 
-        for chunk in CHUNKS:
+    REFS.profiler_surf = hud
 
-            draw_rect(
-                s,
-                'purple',
-                chunk.rect.move(offset_x, offset_y),
-                1,
+def save_level_as_png(must_outline_chunks, must_build_pyramid=False):
+    """Export level as .png image, assembled from chunk-sized tiles.
+
+    Tiles from previous exports are reused from their cache, so only the
+    ones whose objects changed are rendered again.
+
+    If must_build_pyramid is true, the level is also exported as a deep
+    zoom image (level.dzi plus the level_files folder), in the same pass.
+    """
+    start = perf_counter()
+
+    ### make sure objects of all chunks are available
+    LEVEL.load_all_chunks()
+
+    ### create rect union from objs
+
+    one, *rest = (
+        obj_id
+        for chunk in CHUNKS.values()
+        for obj_id in chunk.objs
+    )
+
+    union = get_obj_rect(one).unionall(
+        [get_obj_rect_tuple(obj_id) for obj_id in rest]
+    )
+
+    ### export
+
+    cache = ExportCache(
+        CACHE_DIR / 'export' / level_path.name,
+        STORE.asset_names,
+    )
+
+    pyramid_writer = (
+        PyramidWriter(LEVELS_DIR / 'level.dzi', *union.size)
+        if must_build_pyramid
+        else None
+    )
+
+    export_tiled(
+        LEVELS_DIR / 'level.png',
+        (
+            (
+                OBJ_LAYERS[obj_id],
+                OBJ_ASSETS[obj_id],
+                OBJ_SIZED[obj_id],
+                *get_obj_rect_tuple(obj_id),
             )
+            for chunk in CHUNKS.values()
+            for obj_id in chunk.objs
+        ),
+        union,
+        LEVEL.origin,
+        VICINITY_SIZE,
+        cache,
+        get_record_image,
+        (
+            [Rect(chunk.rect) for chunk in CHUNKS.values()]
+            if must_outline_chunks
+            else ()
+        ),
+        pyramid_writer,
+    )
+
+    if pyramid_writer is not None:
+        pyramid_writer.close()
+
+    cache.prune()
 
-    ### save layer on disk as image
-    save_image(s, str(LEVELS_DIR / 'level.png'))
+    formats = '.png and deep zoom image' if must_build_pyramid else '.png'
+
+    print(
+        f"Exported level as {formats}"
+        f" in {(perf_counter() - start) * 1000:.1f} ms"
+        f" ({cache.rendered_count} tiles rendered,"
+        f" {cache.compressed_count} bands of rows compressed)."
+    )
@@ -0,0 +1,332 @@
+"""Facility for locating, parsing and loading image assets."""
+
+### standard library imports
+
+from itertools import chain, repeat
+
+from math import ceil, sqrt
+
+from ast import literal_eval
+
+from hashlib import sha1
+
+from struct import unpack
+
+from time import perf_counter
+
+import marshal
+
+from warnings import warn
+
+
+### local import
+
+from .config import NO_COLORKEY_ASSETS_DIR, COLORKEY_ASSETS_DIR
+
+from .ourstdlibs.tempsave import (
+    save_image_through_temp,
+    write_bytes_through_temp,
+)
+
+
+
+COLOR_KEY = (192, 192, 192)
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+### texture atlas
+##
+## rather than loading each image asset separately, the assets are
+## packed in a single image, the atlas, described by a manifest listing
+## the data of each asset and the area it occupies in the atlas; both
+## are kept in a cache folder and rebuilt whenever the assets change
+
+## atlases are saved as .tga files, like the tiles cached when
+## exporting levels (see export.ExportCache.get_tile()); manifests are
+## encoded with the marshal module, which is much faster to load than
+## parsing a python literal
+ATLAS_NAME = 'atlas.tga'
+MANIFEST_NAME = 'manifest.marshal'
+
+## version of the atlas format, stored in manifests so that atlases with
+## a different format are considered stale
+ATLAS_VERSION = 1
+
+
+def iter_asset_paths():
+    """Yield (image_path, has_transparency) pairs for each image asset.
+
+    Assets in the colorkey folder have transparency, that is, they use
+    the COLOR_KEY as a colorkey. Non-PNG files are ignored.
+    """
+    for image_path, has_transparency in chain(
+        zip(NO_COLORKEY_ASSETS_DIR.iterdir(), repeat(False)),
+        zip(COLORKEY_ASSETS_DIR.iterdir(), repeat(True)),
+    ):
+
+        suffix = image_path.suffix.lower()
+
+        if suffix != '.png':
+
+            warn("Non-PNG image asset ignored.", RuntimeWarning)
+            continue
+
+        yield image_path, has_transparency
+
+
+def get_assets_stamp():
+    """Return string identifying the current version of the assets.
+
+    It changes whenever an image asset is added, removed, renamed or
+    modified, so it can be used to invalidate data derived from them.
+    """
+    stats = sorted(
+        (image_path.name, stat.st_size, stat.st_mtime_ns)
+        for image_path, _ in iter_asset_paths()
+        for stat in (image_path.stat(),)
+    )
+
+    return sha1(repr(stats).encode('utf-8')).hexdigest()
+
+
+def parse_asset_path(image_path):
+    """Return dict with asset data indicated in the name of its file.
+
+    For instance, for grunt_bot.actors.False.midbottom.png, the asset
+    name is 'grunt_bot', it is placed in the 'actors' layer, it is not
+    seamless and its position is assigned to its 'midbottom'.
+    """
+    layer_name, is_seamless, pos_name, _ = image_path.suffixes
+
+    name = image_path.name
+
+    return {
+        'name' : name[:name.index('.')],
+        'layer_name' : layer_name[1:],
+        'pos_name': pos_name[1:],
+        'is_seamless': literal_eval(is_seamless[1:]),
+    }
+
+
+def new_seamless_image(surf, size):
+    """Return surface of given size with surf tiled over it.
+
+    The new surface has the same format as surf and, if surf has a
+    colorkey, the area not covered by tiles uses it too.
+    """
+    from pygame import Rect, Surface
+
+    rect = surf.get_rect()
+    area = Rect(0, 0, *size)
+
+    area_surf = Surface(size, 0, surf)
+
+    if surf.get_colorkey():
+
+        area_surf.fill(COLOR_KEY)
+        area_surf.set_colorkey(COLOR_KEY)
+
+    blit_on_area = area_surf.blit
+
+    while rect.top < area.bottom:
+
+        blit_on_area(surf, rect)
+
+        rect.left = rect.right
+
+        if rect.left > area.right:
+
+            rect.top = rect.bottom
+            rect.left = 0
+
+    return area_surf
+
+
+def get_png_size(image_path):
+    """Return (width, height) of .png image, read from its header.
+
+    That is, from the IHDR chunk, which comes right after the signature.
+    """
+    with open(str(image_path), mode='rb') as f:
+        header = f.read(24)
+
+    if header[:8] != PNG_SIGNATURE or header[12:16] != b'IHDR':
+        raise ValueError(f"{image_path} isn't a valid .png image.")
+
+    return unpack('>II', header[16:24])
+
+
+def load_asset_specs():
+    """Return map of asset names to (pos_name, size, is_seamless) tuples.
+
+    Only the headers of the image files are read, so this is quick and
+    works without pygame.
+    """
+    specs = {}
+
+    for image_path, _ in iter_asset_paths():
+
+        asset_data = parse_asset_path(image_path)
+
+        specs[asset_data['name']] = (
+            asset_data['pos_name'],
+            get_png_size(image_path),
+            asset_data['is_seamless'],
+        )
+
+    return specs
+
+
+def pack_sizes(sizes):
+    """Return size of atlas and topleft of each given size packed in it.
+
+    Sizes are packed in shelves (rows as tall as their tallest item),
+    from the tallest to the shortest, within a width close to the side
+    of a square with their total area.
+    """
+    atlas_width = max(
+        max(width for width, _ in sizes),
+        ceil(sqrt(sum(width * height for width, height in sizes))),
+    )
+
+    positions = [None] * len(sizes)
+
+    x = y = shelf_height = 0
+
+    for index in sorted(
+        range(len(sizes)),
+        key=lambda index: sizes[index][::-1],
+        reverse=True,
+    ):
+
+        width, height = sizes[index]
+
+        if x + width > atlas_width:
+
+            y += shelf_height
+            x = shelf_height = 0
+
+        positions[index] = (x, y)
+
+        x += width
+        shelf_height = max(shelf_height, height)
+
+    return (atlas_width, y + shelf_height), positions
+
+
+def build_atlas(dirpath, stamp):
+    """Pack image assets in atlas, saving it and its manifest in dirpath.
+
+    Returns the manifest and the atlas surface.
+    """
+    from pygame import Surface
+    from pygame.image import load as load_image
+
+    entries = []
+    surfs = []
+
+    for image_path, has_transparency in iter_asset_paths():
+
+        entries.append([parse_asset_path(image_path), has_transparency])
+        surfs.append(load_image(str(image_path)))
+
+    atlas_size, positions = pack_sizes([surf.get_size() for surf in surfs])
+
+    atlas = Surface(atlas_size, 0, 32)
+    atlas.fill(COLOR_KEY)
+
+    for entry, surf, pos in zip(entries, surfs, positions):
+
+        ## images are converted to the format of the atlas beforehand,
+        ## so any per-pixel alpha is dropped rather than blended, like
+        ## when loading them separately
+        atlas.blit(surf.convert(atlas), pos)
+
+        entry.append((*pos, *surf.get_size()))
+
+    manifest = {
+        'version': ATLAS_VERSION,
+        'stamp': stamp,
+        'assets': [tuple(entry) for entry in entries],
+    }
+
+    ### save atlas before manifest, so a manifest is never saved with an
+    ### atlas other than its own
+
+    dirpath.mkdir(parents=True, exist_ok=True)
+
+    save_image_through_temp(atlas, dirpath / ATLAS_NAME)
+    write_bytes_through_temp(dirpath / MANIFEST_NAME, marshal.dumps(manifest))
+
+    return manifest, atlas
+
+
+def load_atlas(dirpath):
+    """Return manifest and surface of atlas of assets in dirpath.
+
+    The atlas is built (or rebuilt) if it is missing or stale, that is,
+    if the assets changed since it was built.
+    """
+    from pygame.image import load as load_image
+
+    stamp = get_assets_stamp()
+
+    try:
+
+        manifest = marshal.loads((dirpath / MANIFEST_NAME).read_bytes())
+
+        if (
+            manifest['version'] == ATLAS_VERSION
+            and manifest['stamp'] == stamp
+        ):
+            return manifest, load_image(str(dirpath / ATLAS_NAME))
+
+    ## if the files can't be loaded (for instance, if they are missing or
+    ## were corrupted), we just build the atlas again
+    except Exception:
+        pass
+
+    start = perf_counter()
+
+    manifest, atlas = build_atlas(dirpath, stamp)
+
+    print(
+        f"Packed {len(manifest['assets'])} assets in atlas"
+        f" in {(perf_counter() - start) * 1000:.1f} ms"
+        " (atlas missing or stale, cached it for next time)."
+    )
+
+    return manifest, atlas
+
+
+def load_assets(dirpath, format_surf=None):
+    """Return map of asset names to asset data, including surfaces.
+
+    Asset data are the dicts returned by parse_asset_path(), plus the
+    surface of the asset under the 'surf' key, which is a subsurface of
+    the atlas of assets kept in dirpath (see load_atlas()), converted to
+    the format of format_surf or, if not given, of the display. The
+    COLOR_KEY is set as the colorkey of assets with transparency.
+    """
+    manifest, atlas = load_atlas(dirpath)
+
+    atlas = (
+        atlas.convert()
+        if format_surf is None
+        else atlas.convert(format_surf)
+    )
+
+    asset_data_map = {}
+
+    for asset_data, has_transparency, rect in manifest['assets']:
+
+        surf = atlas.subsurface(rect)
+
+        if has_transparency:
+            surf.set_colorkey(COLOR_KEY)
+
+        asset_data['surf'] = surf
+
+        asset_data_map[asset_data['name']] = asset_data
+
+    return asset_data_map
@@ -0,0 +1,580 @@
+"""Benchmark of the editor's hot paths on synthetic levels.
+
+Run from the command line:
+
+    python -m bblueleveleditor.benchmark [-o results.json]
+
+For each scenario (a number of objects and a layout), a synthetic level
+is generated in a temporary folder and the benchmark is run on it in a
+new process, since importing the app loads the level from the levels
+folder. The display uses SDL's dummy video driver, so no window is
+opened.
+
+Layouts are:
+
+dense
+    regular objects filling a rectangle, side by side;
+sparse
+    regular objects scattered over an area four times as big;
+seamless
+    mostly objects of seamless assets, with random sizes.
+
+The timings are printed as a table and written as JSON, along with the
+commit and versions used, so results of different commits can be
+compared, which can be done with --compare.
+"""
+
+### standard library imports
+
+import os
+
+import sys
+
+import json
+
+from math import isqrt
+
+from random import Random
+
+from pathlib import Path
+
+from platform import platform, python_version
+
+from statistics import mean
+
+from subprocess import run, DEVNULL, PIPE
+
+from tempfile import TemporaryDirectory
+
+from time import perf_counter, strftime
+
+
+### local imports
+
+from .assets import iter_asset_paths, parse_asset_path, load_asset_specs
+
+from .ourstdlibs.pyl import save_pyl
+
+
+
+LAYOUTS = ('dense', 'sparse', 'seamless')
+
+DEFAULT_OBJECT_COUNTS = (10_000, 100_000)
+
+### size of the grid in which objects are placed
+UNIT = 16
+
+### number of frames of the scrolling tour and of each editing stroke
+TOUR_FRAMES = 300
+STROKE_FRAMES = 150
+
+
+### synthetic level generation
+
+def get_asset_layer_names():
+    """Return map of asset names to the names of their layers."""
+
+    return {
+        asset_data['name']: asset_data['layer_name']
+        for asset_data in (
+            parse_asset_path(image_path)
+            for image_path, _ in iter_asset_paths()
+        )
+    }
+
+def generate_level(
+    object_count,
+    layout,
+    asset_specs,
+    asset_layer_names,
+    seed=0,
+):
+    """Return level data with given number of objects in given layout.
+
+    asset_specs
+        Map of asset names to (pos_name, size, is_seamless) tuples, as
+        returned by assets.load_asset_specs().
+    asset_layer_names
+        Map of asset names to the names of their layers, as returned by
+        get_asset_layer_names().
+
+    The same arguments always produce the same level.
+    """
+    from pygame import Rect
+
+    rand = Random(seed)
+
+    asset_specs = sorted(
+        (asset_name, asset_layer_names[asset_name], *spec)
+        for asset_name, spec in asset_specs.items()
+    )
+
+    seamless_specs = [spec for spec in asset_specs if spec[4]]
+
+    ### number of columns and rows of the grid of cells in which the
+    ### objects are placed (roughly in the aspect ratio of the screen)
+
+    cell_count = object_count * (4 if layout == 'sparse' else 1)
+
+    cols = max(1, isqrt(cell_count * 16 // 9))
+    rows = -(-cell_count // cols)
+
+    if layout == 'dense':
+        cells = range(object_count)
+
+    else:
+        cells = rand.sample(range(cols * rows), object_count)
+
+    ### seamless objects get cells 4 units wide, so they have room to be
+    ### up to 4 units wide and tall
+    cell_size = UNIT * (4 if layout == 'seamless' else 1)
+
+    layered_objects = {}
+
+    for cell in cells:
+
+        x = (cell % cols) * cell_size
+        y = (cell // cols) * cell_size
+
+        if layout == 'seamless' and rand.random() < 0.8:
+
+            name, layer_name, pos_name, _, _ = rand.choice(seamless_specs)
+
+            size = own_size = (
+                UNIT * rand.randint(1, 4),
+                UNIT * rand.randint(1, 4),
+            )
+
+        else:
+
+            name, layer_name, pos_name, size, _ = rand.choice(asset_specs)
+            own_size = None
+
+        obj_data = {
+            'name': name,
+            'pos': getattr(Rect((x, y), size), pos_name),
+        }
+
+        if own_size is not None:
+            obj_data['size'] = own_size
+
+        layered_objects.setdefault(layer_name, []).append(obj_data)
+
+    return {'layered_objects': layered_objects}
+
+
+### benchmark run on each scenario, in its own process
+
+def time_call(func, *args, **kwargs):
+    """Return time taken to call func, in milliseconds."""
+
+    start = perf_counter()
+    func(*args, **kwargs)
+
+    return (perf_counter() - start) * 1000
+
+def run_benchmark(levels_dir, result_path):
+    """Benchmark the app on the level in levels_dir, saving the results.
+
+    Must be run in its own process, before the app is imported.
+    """
+    ### point the app to the folders of the scenario before importing it
+
+    from . import config
+
+    config.LEVELS_DIR = levels_dir
+    config.CACHE_DIR = levels_dir / 'cache'
+
+    level_path = next(levels_dir.glob('level.lvl*'))
+
+    timings = {}
+
+    ### level loading (the cache created here is used when the app is
+    ### imported)
+
+    if level_path.suffix == '.lvl':
+
+        from .ourstdlibs.pyl import load_pyl
+
+        timings['level_parse'] = time_call(load_pyl, level_path)
+
+        load_pyl(level_path, use_cache=True)
+
+        timings['level_load_cached'] = (
+            time_call(load_pyl, level_path, use_cache=True)
+        )
+
+    else:
+
+        from .levelformat import LvlbReader
+
+        timings['level_index'] = time_call(
+            lambda: LvlbReader(level_path).close()
+        )
+
+    ### grouping of objects in chunks, on the level loaded by the
+    ### headless level model, without the app
+
+    from .level import Level
+    from .levelformat import DEFAULT_CHUNK_SIZE
+
+    level = Level(level_path, load_asset_specs(), DEFAULT_CHUNK_SIZE)
+
+    timings['instantiate_and_group_objects'] = (
+        time_call(level.load_objects)
+    )
+
+    level.close()
+
+    ### app import, which also loads assets and the level
+
+    start = perf_counter()
+
+    from . import app
+
+    timings['app_import'] = (perf_counter() - start) * 1000
+
+    ### scrolling tour, as when holding D and then S, drawing each frame
+
+    app.VICINITY_RECT.center = app.CAMERA_RECT.center
+    app.update_chunks_and_layers()
+
+    scroll_times = []
+    draw_times = []
+
+    for frame in range(TOUR_FRAMES):
+
+        dx, dy = (-8, 0) if frame < TOUR_FRAMES * 3 // 4 else (0, -8)
+
+        scroll_times.append(time_call(app.scroll, dx, dy))
+        draw_times.append(time_call(app.draw))
+
+    for name, frame_times in (
+        ('scroll', scroll_times),
+        ('draw', draw_times),
+    ):
+        timings[name + '_frame_mean'] = mean(frame_times)
+        timings[name + '_frame_max'] = max(frame_times)
+
+    ### strokes adding and then deleting objects of a regular asset, with
+    ### the mouse moving diagonally across the screen
+
+    from pygame.mouse import set_pos as set_mouse_pos
+    from pygame.event import pump, clear as clear_events
+
+    while app.asset_data_map[app.REFS.current_asset]['is_seamless']:
+
+        app.asset_name_deque.rotate(-1)
+        app.update_asset_refs()
+
+    def stroke(routine):
+
+        for frame in range(STROKE_FRAMES):
+
+            set_mouse_pos(
+                (
+                    8 + 300 * frame // STROKE_FRAMES,
+                    40 + 100 * frame // STROKE_FRAMES,
+                )
+            )
+
+            pump()
+
+            app.update_unit_rect_topleft()
+            routine()
+
+        clear_events()
+
+    object_count = len(app.STORE)
+
+    timings['add_stroke'] = time_call(stroke, app.add_asset)
+    added_count = len(app.STORE) - object_count
+
+    timings['delete_stroke'] = time_call(stroke, app.delete_asset)
+    deleted_count = object_count + added_count - len(app.STORE)
+
+    ### saving
+
+    def save():
+
+        app.save_level()
+        app.wait_for_saving()
+
+    timings['save'] = time_call(save)
+
+    ### exporting as .png, the second time with the tiles cached
+
+    timings['export_png'] = time_call(app.save_level_as_png, False)
+    timings['export_png_cached'] = time_call(app.save_level_as_png, False)
+
+    ###
+
+    result_path.write_text(
+        json.dumps(
+            {
+                'objects': len(app.STORE),
+                'chunks': len(app.CHUNKS),
+                'added_in_stroke': added_count,
+                'deleted_in_stroke': deleted_count,
+                'timings_ms': timings,
+            }
+        ),
+        encoding='utf-8',
+    )
+
+
+### running scenarios and reporting results
+
+def run_scenarios(object_counts, layouts, level_format, is_verbose):
+    """Run benchmark on each scenario, returning list of results."""
+
+    from .levelformat import convert_lvl_to_lvlb
+
+    asset_specs = load_asset_specs()
+    asset_layer_names = get_asset_layer_names()
+
+    results = []
+
+    for object_count in object_counts:
+
+        for layout in layouts:
+
+            name = f'{layout}_{object_count}'
+
+            print(f"Running {name}...", file=sys.stderr)
+
+            with TemporaryDirectory() as temp_dir:
+
+                temp_dir = Path(temp_dir)
+
+                ## generate level
+
+                level_path = temp_dir / 'level.lvl'
+
+                save_pyl(
+                    generate_level(
+                        object_count,
+                        layout,
+                        asset_specs,
+                        asset_layer_names,
+                    ),
+                    level_path,
+                )
+
+                if level_format == 'lvlb':
+
+                    convert_lvl_to_lvlb(
+                        level_path,
+                        level_path.with_suffix('.lvlb'),
+                        asset_specs,
+                    )
+
+                    level_path.unlink()
+
+                ## run benchmark in its own process
+
+                result_path = temp_dir / 'result.json'
+
+                completed = run(
+                    [
+                        sys.executable,
+                        '-m',
+                        __spec__.name,
+                        '--run-in',
+                        str(temp_dir),
+                    ],
+                    cwd=str(Path(__file__).resolve().parent.parent),
+                    env={**os.environ, 'SDL_VIDEODRIVER': 'dummy'},
+                    stdout=None if is_verbose else DEVNULL,
+                    stderr=None if is_verbose else PIPE,
+                    text=True,
+                )
+
+                if completed.returncode:
+
+                    print(completed.stderr or '', file=sys.stderr)
+
+                    raise RuntimeError(f"Scenario {name} failed.")
+
+                result = json.loads(result_path.read_text(encoding='utf-8'))
+
+            results.append(
+                {
+                    'scenario': name,
+                    'layout': layout,
+                    'format': level_format,
+                    **result,
+                }
+            )
+
+    return results
+
+def get_commit():
+    """Return hash of current commit of the repository, if available."""
+
+    completed = run(
+        ['git', 'rev-parse', 'HEAD'],
+        cwd=str(Path(__file__).resolve().parent),
+        capture_output=True,
+        text=True,
+    )
+
+    return completed.stdout.strip() or None
+
+def print_table(results, get_value, value_format):
+    """Print table of values of each timing (rows) in each scenario."""
+
+    names = list(results[0]['timings_ms'])
+
+    print(
+        f"{'':30}"
+        + ''.join(f"{result['scenario']:>18}" for result in results)
+    )
+
+    for name in names:
+
+        values = [get_value(result, name) for result in results]
+
+        print(
+            f"{name:30}"
+            + ''.join(
+                f"{'-' if value is None else value_format(value):>18}"
+                for value in values
+            )
+        )
+
+
+if __name__ == '__main__':
+
+    from argparse import ArgumentParser, SUPPRESS
+
+    parser = ArgumentParser(
+        description="Benchmark the editor's hot paths on synthetic levels."
+    )
+
+    parser.add_argument(
+        '-n',
+        '--objects',
+        type=int,
+        nargs='+',
+        default=DEFAULT_OBJECT_COUNTS,
+        help=(
+            "numbers of objects of the levels generated; defaults to"
+            " 10000 and 100000 (try 1000000 for huge levels)"
+        ),
+    )
+
+    parser.add_argument(
+        '-l',
+        '--layouts',
+        nargs='+',
+        choices=LAYOUTS,
+        default=LAYOUTS,
+        help="layouts of the levels generated; defaults to all",
+    )
+
+    parser.add_argument(
+        '-f',
+        '--format',
+        choices=('lvl', 'lvlb'),
+        default='lvl',
+        help="format of the level files; defaults to lvl",
+    )
+
+    parser.add_argument(
+        '-o',
+        '--output',
+        type=Path,
+        help="path of the JSON file with the results",
+    )
+
+    parser.add_argument(
+        '-c',
+        '--compare',
+        type=Path,
+        help=(
+            "JSON file with results of a previous run, to print the"
+            " ratios between the timings of both runs"
+        ),
+    )
+
+    parser.add_argument(
+        '-v',
+        '--verbose',
+        action='store_true',
+        help="show the output of the app",
+    )
+
+    ## used to run the benchmark of a scenario in its own process
+    parser.add_argument('--run-in', type=Path, help=SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.run_in is not None:
+
+        run_benchmark(args.run_in, args.run_in / 'result.json')
+        sys.exit()
+
+    ### run scenarios
+
+    import pygame
+
+    report = {
+        'commit': get_commit(),
+        'date': strftime('%Y-%m-%d %H:%M:%S'),
+        'python': python_version(),
+        'pygame': pygame.version.ver,
+        'platform': platform(),
+        'results': run_scenarios(
+            args.objects,
+            args.layouts,
+            args.format,
+            args.verbose,
+        ),
+    }
+
+    ### report results
+
+    if args.output is not None:
+
+        args.output.write_text(
+            json.dumps(report, indent=2),
+            encoding='utf-8',
+        )
+
+    print("\nTimings (ms):\n")
+
+    print_table(
+        report['results'],
+        lambda result, name: result['timings_ms'][name],
+        '{:.1f}'.format,
+    )
+
+    if args.compare is not None:
+
+        previous = json.loads(args.compare.read_text(encoding='utf-8'))
+
+        previous_results = {
+            result['scenario']: result
+            for result in previous['results']
+        }
+
+        def get_ratio(result, name):
+
+            try:
+
+                return (
+                    result['timings_ms'][name]
+                    / previous_results[result['scenario']]['timings_ms'][name]
+                )
+
+            except (KeyError, ZeroDivisionError):
+                return None
+
+        print(
+            "\nRatios to the timings of"
+            f" {previous['commit'] or args.compare.name}"
+            " (below 1 means faster):\n"
+        )
+
+        print_table(report['results'], get_ratio, '{:.2f}'.format)
@@ -16,9 +16,15 @@ NO_COLORKEY_ASSETS_DIR = _ASSETS_DIR / 'no_colorkey'
 
 LEVELS_DIR = _HERE / 'levels'
 
+CACHE_DIR = _HERE / 'cache'
 
-if not LEVELS_DIR.exists():
-    LEVELS_DIR.mkdir()
+BG_COLOR = 'lightblue'
 
-elif LEVELS_DIR.is_file():
-    raise RuntimeError("{LEVELS_DIR} must either be a folder or not exist.")
+
+for _dirpath in (LEVELS_DIR, CACHE_DIR):
+
+    if not _dirpath.exists():
+        _dirpath.mkdir()
+
+    elif _dirpath.is_file():
+        raise RuntimeError(f"{_dirpath} must either be a folder or not exist.")
@@ -0,0 +1,798 @@
+"""Facility for exporting levels as .png images.
+
+The image is rendered in horizontal strips, each one written to the
+.png file as soon as it is ready, so the memory used is bounded by the
+size of the strips rather than the size of the level.
+
+The app exports levels with export_tiled(), which assembles the strips
+from tiles cached between exports, so only tiles whose objects changed
+are rendered again (see ExportCache).
+
+Besides the functions used by the app, this module also provides
+a headless export, run from the command line, which renders the strips
+in parallel in worker processes, from the level file and asset files:
+
+    python -m bblueleveleditor.export [level_file] [-o output] [-j jobs]
+
+Pass --outline-chunks to also outline the level chunks, as when
+exporting from the app while holding Shift.
+"""
+
+### standard library imports
+
+from contextlib import redirect_stdout
+
+from io import StringIO
+
+from hashlib import sha1
+
+from collections import deque
+
+from concurrent.futures import ProcessPoolExecutor
+
+from operator import itemgetter
+
+from os import cpu_count
+
+from pathlib import Path
+
+from time import perf_counter
+
+import marshal
+
+
+### third-party imports
+
+## as in the app, our first pygame import has the stdout redirected, to
+## prevent the default message to be printed (here, by each worker)
+
+with StringIO() as temp_stream:
+    with redirect_stdout(temp_stream):
+        from pygame import Rect, Surface, error as PygameError
+
+from pygame.draw import rect as draw_rect
+
+from pygame.image import (
+    load as load_image,
+    tobytes as image_to_bytes,
+)
+
+
+### local imports
+
+from .config import LEVELS_DIR, BG_COLOR
+
+from .assets import (
+    COLOR_KEY,
+    iter_asset_paths,
+    parse_asset_path,
+    get_assets_stamp,
+    new_seamless_image,
+    load_asset_specs,
+)
+
+from .objectstore import ObjectStore
+
+from .levelformat import LvlbReader, DEFAULT_CHUNK_SIZE
+
+from .level import find_level_path
+
+from .ourstdlibs.pyl import load_pyl
+
+from .ourstdlibs.pngwriter import PNGWriter, compress_rows
+
+from .ourstdlibs.tempsave import (
+    save_image_through_temp,
+    write_bytes_through_temp,
+)
+
+
+
+### maximum size of the strips in which the level is rendered
+STRIP_BYTES = 16 * 1024 * 1024
+
+### color of chunk outlines
+OUTLINE_COLOR = 'purple'
+
+
+def get_strip_height(width, height, strip_count=1):
+    """Return height of strips to render image with given size.
+
+    Strips are as tall as possible within STRIP_BYTES, but short enough
+    for the image to be split into at least strip_count strips, if
+    possible.
+    """
+    return max(
+        1,
+        min(
+            STRIP_BYTES // (width * 4),
+            -(-height // strip_count),
+        ),
+    )
+
+def iter_in_draw_order(records):
+    """Yield records without the layer id, in the order objects are drawn.
+
+    records
+        Iterable of (layer_id, asset_id, has_size, x, y, width, height)
+        tuples, where (x, y, width, height) is the rect of the object.
+
+    Objects are drawn layer by layer and, in each layer, from top to
+    bottom and left to right, so the image doesn't depend on the order
+    in which objects were loaded or added.
+    """
+    for _, *record in sorted(records, key=itemgetter(0, 4, 3, 1, 5, 6)):
+        yield tuple(record)
+
+def group_by_strip(records, top, strip_height, strip_count):
+    """Return list with records of objects touching each strip.
+
+    records
+        Iterable of records as expected by iter_in_draw_order().
+    top
+        Integer, y coordinate of the top of the first strip.
+
+    Records are listed without the layer id and in the order objects
+    are drawn.
+    """
+    strip_records = [[] for _ in range(strip_count)]
+
+    for record in iter_in_draw_order(records):
+
+        y = record[3] - top
+
+        for index in range(
+            y // strip_height,
+            (y + record[5] - 1) // strip_height + 1,
+        ):
+            strip_records[index].append(record)
+
+    return strip_records
+
+def group_by_tile(records, origin, tile_size):
+    """Return map of (column, row) cells to records of objects touching them.
+
+    records
+        Iterable of records as expected by iter_in_draw_order().
+    origin, tile_size
+        Integer pairs, the topleft of the tile in the (0, 0) cell and
+        the size of tiles.
+
+    Records are listed without the layer id and in the order objects
+    are drawn.
+    """
+    origin_x, origin_y = origin
+    tile_width, tile_height = tile_size
+
+    tile_records = {}
+
+    for record in iter_in_draw_order(records):
+
+        _, _, x, y, width, height = record
+
+        x -= origin_x
+        y -= origin_y
+
+        for row in range(
+            y // tile_height,
+            (y + height - 1) // tile_height + 1,
+        ):
+
+            for col in range(
+                x // tile_width,
+                (x + width - 1) // tile_width + 1,
+            ):
+                tile_records.setdefault((col, row), []).append(record)
+
+    return tile_records
+
+def render_strip(surf, records, offset, get_image, outline_rects=()):
+    """Render objects and chunk outlines on strip surf.
+
+    records
+        List of (asset_id, has_size, x, y, width, height) tuples of
+        objects touching the strip, as listed by group_by_strip().
+    offset
+        Pair of integers, offset from level positions to positions in
+        the strip.
+    get_image
+        Callable returning image of object given the items of its record
+        other than its position.
+    outline_rects
+        Rects of chunks to outline, in level positions.
+    """
+    surf.fill(BG_COLOR)
+
+    offset_x, offset_y = offset
+
+    surf.blits(
+        [
+            (
+                get_image(asset_id, has_size, width, height),
+                (x + offset_x, y + offset_y),
+            )
+            for asset_id, has_size, x, y, width, height in records
+        ],
+        False,
+    )
+
+    draw_outlines(surf, outline_rects, offset)
+
+def draw_outlines(surf, outline_rects, offset):
+    """Outline rects touching the strip surf, moved by offset."""
+
+    strip_height = surf.get_height()
+
+    for rect in outline_rects:
+
+        rect = rect.move(offset)
+
+        if rect.top < strip_height and rect.bottom > 0:
+            draw_outline(surf, OUTLINE_COLOR, rect)
+
+def draw_outline(surf, color, rect):
+    """Draw 1-pixel outline of rect, as pygame.draw.rect() with width 1.
+
+    Unlike pygame.draw.rect(), which outlines the part of the rect
+    within the surface when it is only partially within it, this draws
+    each edge as a filled rect, so edges outside the surface aren't
+    drawn.
+    """
+    x, y, width, height = rect
+
+    for edge in (
+        (x, y, width, 1),
+        (x, y + height - 1, width, 1),
+        (x, y, 1, height),
+        (x + width - 1, y, 1, height),
+    ):
+        draw_rect(surf, color, edge)
+
+
+### export reusing tiles rendered in previous exports
+
+class ExportCache:
+    """Folder with tiles and rows of tiles from previous exports.
+
+    The image is assembled from rows of tiles, each compressed as it is
+    written (in bands, if the row is too big; see export_tiled()). Both
+    tiles and compressed rows are saved in files named
+    after a hash of everything affecting their pixels: for tiles, their
+    size, the objects touching them (relative to their topleft and in
+    the order they are drawn), the background color and the version of
+    the assets; for rows, their area, their tiles and the chunk outlines
+    crossing them.
+
+    Thus, only the tiles whose objects changed since the last export are
+    rendered again and only the rows with such tiles are compressed
+    again. Use prune() after an export to delete files not used in it.
+    """
+
+    def __init__(self, dirpath, asset_names):
+
+        self.dirpath = Path(dirpath)
+        self.dirpath.mkdir(parents=True, exist_ok=True)
+
+        ### data affecting the pixels of all tiles
+        self.salt = repr(
+            (get_assets_stamp(), tuple(asset_names), BG_COLOR)
+        ).encode('utf-8')
+
+        ### names of files used and how many tiles were rendered and
+        ### rows were compressed
+
+        self.used_names = set()
+
+        self.rendered_count = 0
+        self.compressed_count = 0
+
+    def get_name(self, data, suffix):
+        """Return name of file holding what is described by data."""
+
+        digest = sha1(self.salt)
+        digest.update(repr(data).encode('utf-8'))
+
+        name = digest.hexdigest() + suffix
+        self.used_names.add(name)
+
+        return name
+
+    def get_tile_name(self, rect, records):
+        """Return name of file of tile in rect.
+
+        records
+            List of records of objects touching the tile, as listed by
+            group_by_tile().
+        """
+        x, y, width, height = rect
+
+        return self.get_name(
+            (
+                width,
+                height,
+                [
+                    (
+                        asset_id,
+                        has_size,
+                        obj_x - x,
+                        obj_y - y,
+                        obj_width,
+                        obj_height,
+                    )
+                    for (
+                        asset_id,
+                        has_size,
+                        obj_x,
+                        obj_y,
+                        obj_width,
+                        obj_height,
+                    ) in records
+                ],
+            ),
+            '.tga',
+        )
+
+    def get_tile(self, name, rect, records, get_image):
+        """Return surface of tile in rect, rendering it if needed.
+
+        name
+            String, name returned by get_tile_name() for the tile.
+        get_image
+            Same as in render_strip().
+        """
+        tile_path = self.dirpath / name
+
+        if tile_path.exists():
+
+            try:
+                return load_image(str(tile_path))
+
+            ## if the file can't be loaded (for instance, if it was
+            ## corrupted), we just render the tile again
+            except PygameError:
+                pass
+
+        x, y, width, height = rect
+
+        surf = Surface((width, height), 0, 32)
+        render_strip(surf, records, (-x, -y), get_image)
+
+        ## tiles are saved as .tga files, which, being compressed with
+        ## run-length encoding, are much faster to save than .png files
+        ## and still small
+        save_image_through_temp(surf, tile_path)
+
+        self.rendered_count += 1
+
+        return surf
+
+    def load_segment(self, name):
+        """Return compressed rows saved with given name or None."""
+
+        try:
+            return tuple(marshal.loads((self.dirpath / name).read_bytes()))
+
+        except (OSError, EOFError, ValueError, TypeError):
+            return None
+
+    def save_segment(self, name, segment):
+        """Save compressed rows with given name."""
+
+        self.compressed_count += 1
+
+        write_bytes_through_temp(self.dirpath / name, marshal.dumps(segment))
+
+    def prune(self):
+        """Delete files not used since the cache was created.
+
+        Including temporary files left by interrupted exports.
+        """
+        used_names = self.used_names
+
+        for path in self.dirpath.iterdir():
+
+            if path.name not in used_names:
+
+                try:
+                    path.unlink()
+                except OSError:
+                    pass
+
+def export_tiled(
+    output_path,
+    records,
+    union,
+    origin,
+    tile_size,
+    cache,
+    get_image,
+    outline_rects=(),
+    pyramid_writer=None,
+):
+    """Export level as .png image, assembled from tiles.
+
+    records
+        Iterable of records as expected by iter_in_draw_order().
+    union
+        Rect, the union of the objects' rects, which is the area of the
+        level exported.
+    origin, tile_size
+        Integer pairs, the topleft of the tile in the (0, 0) cell and
+        the size of tiles, usually the ones of the level chunks.
+    cache
+        ExportCache instance from which tiles and compressed rows of
+        tiles are reused when their contents didn't change.
+    get_image, outline_rects
+        Same as in render_strip().
+    pyramid_writer
+        Optional PyramidWriter instance, to which the rows of the image
+        are also written, to build a deep zoom image in the same pass.
+
+    The image is written one row of tiles at a time, each assembled
+    and compressed in bands no bigger than STRIP_BYTES, so memory usage
+    doesn't depend on the width of the level. The tiles of a row are
+    only kept in memory while its bands are assembled.
+    """
+    tile_records = group_by_tile(records, origin, tile_size)
+
+    row_cols = {}
+
+    for col, row in sorted(tile_records):
+        row_cols.setdefault(row, []).append(col)
+
+    origin_x, origin_y = origin
+    tile_width, tile_height = tile_size
+
+    width, height = union.size
+
+    band_height = get_strip_height(width, tile_height)
+    band = Surface((width, band_height), 0, 32)
+
+    with PNGWriter(output_path, width, height) as writer:
+
+        for row in range(
+            (union.top - origin_y) // tile_height,
+            (union.bottom - 1 - origin_y) // tile_height + 1,
+        ):
+
+            strip_top = origin_y + row * tile_height
+            offset = -union.left, -strip_top
+
+            ## tiles in the row and their file names
+
+            tiles = []
+
+            for col in row_cols.get(row, ()):
+
+                rect = Rect(origin_x + col * tile_width, strip_top, *tile_size)
+                records = tile_records[col, row]
+
+                tiles.append(
+                    (rect, records, cache.get_tile_name(rect, records))
+                )
+
+            ## chunk outlines crossing the row
+
+            row_outlines = [
+                tuple(rect.move(offset))
+                for rect in outline_rects
+                if rect.top < strip_top + tile_height
+                and rect.bottom > strip_top
+            ]
+
+            ## rows of the strip within the image
+
+            top = max(union.top, strip_top) - strip_top
+            bottom = min(union.bottom, strip_top + tile_height) - strip_top
+
+            ## surfaces of the tiles, loaded (or rendered) only if a
+            ## band of the row must be assembled, then reused by the
+            ## other bands
+            tile_surfs = None
+
+            for band_top in range(top, bottom, band_height):
+
+                band_bottom = min(band_top + band_height, bottom)
+
+                ## reuse the compressed rows if the same tiles and chunk
+                ## outlines are in the same places, otherwise assemble
+                ## and compress them
+
+                segment_name = cache.get_name(
+                    (
+                        width,
+                        band_top,
+                        band_bottom,
+                        [
+                            (rect.x - union.left, name)
+                            for rect, _, name in tiles
+                        ],
+                        row_outlines,
+                    ),
+                    '.row',
+                )
+
+                segment = cache.load_segment(segment_name)
+
+                ## the rows are assembled if they must be compressed or
+                ## if the pyramid needs them
+
+                if segment is None or pyramid_writer is not None:
+
+                    if tile_surfs is None:
+
+                        tile_surfs = [
+                            cache.get_tile(name, rect, records, get_image)
+                            for rect, records, name in tiles
+                        ]
+
+                    band.fill(BG_COLOR)
+
+                    for (rect, _, _), tile_surf in zip(tiles, tile_surfs):
+                        band.blit(tile_surf, (rect.x - union.left, -band_top))
+
+                    draw_outlines(
+                        band,
+                        outline_rects,
+                        (-union.left, -strip_top - band_top),
+                    )
+
+                    rows = band.subsurface(
+                        (0, 0, width, band_bottom - band_top)
+                    )
+
+                    if pyramid_writer is not None:
+                        pyramid_writer.write_rows(rows)
+
+                if segment is None:
+
+                    segment = compress_rows(
+                        image_to_bytes(rows, 'RGB'),
+                        width * 3,
+                    )
+
+                    cache.save_segment(segment_name, segment)
+
+                writer.write_segment(segment)
+
+
+### headless parallel export
+
+## state of worker processes
+
+_ASSET_SURFS = []
+_SEAMLESS_SURFS_MAP = {}
+
+def init_worker(asset_names):
+    """Load images of assets in the order of their ids."""
+
+    ### since there's no display, images are converted to the format of
+    ### a 32-bit surface, the format of the app's screen
+
+    format_surf = Surface((1, 1), 0, 32)
+
+    surf_map = {}
+
+    for image_path, has_transparency in iter_asset_paths():
+
+        surf = load_image(str(image_path)).convert(format_surf)
+
+        if has_transparency:
+            surf.set_colorkey(COLOR_KEY)
+
+        surf_map[parse_asset_path(image_path)['name']] = surf
+
+    _ASSET_SURFS[:] = [surf_map[asset_name] for asset_name in asset_names]
+
+def get_worker_image(asset_id, has_size, width, height):
+
+    if has_size:
+
+        key = asset_id, width, height
+
+        try:
+            return _SEAMLESS_SURFS_MAP[key]
+
+        except KeyError:
+
+            image = _SEAMLESS_SURFS_MAP[key] = (
+                new_seamless_image(_ASSET_SURFS[asset_id], key[1:])
+            )
+
+            return image
+
+    return _ASSET_SURFS[asset_id]
+
+def render_strip_rows(size, records, offset, outline_rects):
+    """Return compressed rows of strip with given size (run on workers).
+
+    The rows are compressed here too, since compressing them takes
+    longer than rendering them.
+    """
+    surf = Surface(size, 0, 32)
+
+    render_strip(surf, records, offset, get_worker_image, outline_rects)
+
+    return compress_rows(image_to_bytes(surf, 'RGB'), size[0] * 3)
+
+def export_level(level_path, output_path, jobs, must_outline_chunks):
+    """Export level as .png image, rendering strips in parallel."""
+
+    start = perf_counter()
+
+    ### store objects
+
+    store = ObjectStore()
+
+    for asset_name, (pos_name, size, is_seamless) in (
+        load_asset_specs().items()
+    ):
+        store.register_asset(asset_name, pos_name, size, is_seamless)
+
+    if level_path.suffix == '.lvlb':
+
+        with LvlbReader(level_path) as reader:
+
+            store.load_layered_objects(reader.get_layered_objects())
+
+            origin = reader.origin
+            chunk_size = reader.chunk_size
+            cells = {cell for cell, *_ in reader.index}
+
+    else:
+
+        level_data = load_pyl(level_path, use_cache=True)
+        store.load_layered_objects(level_data['layered_objects'])
+
+        origin = store.get_origin()
+        chunk_size = DEFAULT_CHUNK_SIZE
+        cells = store.group_by_cell(origin, chunk_size)
+
+    records = [
+        (
+            store.layers[obj_id],
+            store.assets[obj_id],
+            store.sized[obj_id],
+            *store.get_rect(obj_id),
+        )
+        for obj_id in store.iter_ids()
+    ]
+
+    if not records:
+
+        print(f"{level_path.name} has no objects to export.")
+        return
+
+    ### define strips, with at least a few for each worker, so they
+    ### are kept busy
+
+    _, _, _, x, y, width, height = records[0]
+
+    union = Rect(x, y, width, height).unionall(
+        [record[3:] for record in records]
+    )
+
+    width, height = union.size
+
+    strip_height = get_strip_height(width, height, jobs * 4)
+    strip_count = -(-height // strip_height)
+
+    strip_records = group_by_strip(
+        records,
+        union.top,
+        strip_height,
+        strip_count,
+    )
+
+    chunk_width, chunk_height = chunk_size
+
+    outline_rects = (
+        [
+            Rect(
+                origin[0] + col * chunk_width,
+                origin[1] + row * chunk_height,
+                chunk_width,
+                chunk_height,
+            )
+            for col, row in cells
+        ]
+        if must_outline_chunks
+        else []
+    )
+
+    ### render strips in worker processes, writing them in order; only a
+    ### few strips are submitted ahead of the one being written, so that
+    ### strips waiting to be written don't pile up in memory
+
+    with ProcessPoolExecutor(
+        jobs,
+        initializer=init_worker,
+        initargs=(store.asset_names,),
+    ) as executor:
+
+        with PNGWriter(output_path, width, height) as writer:
+
+            pending = deque()
+
+            for index, records in enumerate(strip_records):
+
+                strip_top = index * strip_height
+
+                pending.append(
+                    executor.submit(
+                        render_strip_rows,
+                        (width, min(strip_height, height - strip_top)),
+                        records,
+                        (-union.left, -union.top - strip_top),
+                        outline_rects,
+                    )
+                )
+
+                if len(pending) >= jobs * 2:
+                    writer.write_segment(pending.popleft().result())
+
+            while pending:
+                writer.write_segment(pending.popleft().result())
+
+    print(
+        f"Exported {level_path.name} as {output_path.name}"
+        f" ({width}x{height}, {strip_count} strips, {jobs} processes)"
+        f" in {perf_counter() - start:.2f} s."
+    )
+
+
+if __name__ == '__main__':
+
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(
+        description="Export level as .png image, rendered in parallel."
+    )
+
+    parser.add_argument(
+        'level_path',
+        type=Path,
+        nargs='?',
+        help=(
+            "level file to export; defaults to the one the app"
+            " would load from the levels folder"
+        ),
+    )
+
+    parser.add_argument(
+        '-o',
+        '--output',
+        type=Path,
+        help=(
+            "path of the .png image; defaults to the level's path"
+            " with the .png suffix"
+        ),
+    )
+
+    parser.add_argument(
+        '-j',
+        '--jobs',
+        type=int,
+        default=cpu_count() or 1,
+        help="number of worker processes; defaults to the number of CPUs",
+    )
+
+    parser.add_argument(
+        '--outline-chunks',
+        action='store_true',
+        help="outline the level chunks",
+    )
+
+    args = parser.parse_args()
+
+    level_path = args.level_path or find_level_path(LEVELS_DIR)
+
+    if not level_path.exists():
+        parser.error(f"level file {level_path} not found.")
+
+    export_level(
+        level_path,
+        args.output or level_path.with_suffix('.png'),
+        max(1, args.jobs),
+        args.outline_chunks,
+    )
@@ -1,8 +1,12 @@
 """Facility for OOP implementation of appcommon.grid.main."""
 
+### standard library import
+from math import lcm
+
+
 ### third-party imports
 
-from pygame import Rect
+from pygame import Rect, Surface, SRCALPHA
 from pygame.draw import line as draw_line
 
 
@@ -76,37 +80,169 @@ class ScrollableGrid:
         ## also reference all lines in a single list
         self.all_lines = [*self.h_lines, *self.v_lines]
 
+        ### create attributes to keep track of scrolling
+        ###
+        ### the scrolling is the total amount of scrolling
+        ### performed, used by GridOverlay, while the pending
+        ### deltas are the scrolling not yet applied to the
+        ### line vectors, which we only move when they are about
+        ### to be drawn
+
+        self.scrolling = [0, 0]
+
+        self.pending_dx = 0
+        self.pending_dy = 0
+
     def draw(self):
         """Draw lines on screen."""
+
+        if self.pending_dx or self.pending_dy:
+            self.move_lines()
+
         for point_pair in self.all_lines:
 
             draw_line(self.screen, self.color, *point_pair, self.line_width)
 
     def scroll(self, dx, dy):
-        """Scroll line vectors relative to dx and dy amounts.
+        """Keep track of scrolling relative to dx and dy amounts.
+
+        The line vectors are only moved when drawing the lines.
 
         dx, dy
             Integers representing amount in pixels of a
             movement in the x and y axes, respectively.
         """
+        scrolling = self.scrolling
+
+        scrolling[0] += dx
+        scrolling[1] += dy
+
+        self.pending_dx += dx
+        self.pending_dy += dy
+
+    def move_lines(self):
+        """Scroll line vectors relative to pending dx and dy amounts."""
+
         ### scroll grid vertical lines
 
-        if dx:
+        if self.pending_dx:
+
             move_grid_lines_along_axis(
                 self.v_lines,
                 "x",
-                dx,
+                self.pending_dx,
                 self.unit_rect,
                 self.area_rect,
             )
 
+            self.pending_dx = 0
+
         ### scroll grid horizontal lines
 
-        if dy:
+        if self.pending_dy:
+
             move_grid_lines_along_axis(
                 self.h_lines,
                 "y",
-                dy,
+                self.pending_dy,
                 self.unit_rect,
                 self.area_rect,
             )
+
+            self.pending_dy = 0
+
+
+class GridOverlay:
+    """Pre-rendered overlay of one or more scrollable grids.
+
+    Rather than drawing each line of each grid every frame,
+    the lines of all grids are drawn once on a transparent
+    tile surface, which is then blit with an offset derived
+    from the scrolling of the grids, giving the same result.
+    """
+
+    def __init__(self, screen, grids, area_rect=SCREEN_RECT):
+        """Render and store tile with lines of given grids.
+
+        screen
+            Any pygame.Surface instance where you want the
+            overlay blit.
+        grids
+            Iterable of ScrollableGrid instances, composited
+            in the given order. They are expected to always
+            be scrolled together, since the scrolling amount
+            is taken from the first one.
+        area_rect
+            pygame.Rect instance representing the area
+            covered by the overlay.
+        """
+        self.screen = screen
+        self.grids = grids = tuple(grids)
+        self.area_rect = area_rect
+
+        ### the tile must have the lines of all grids repeat
+        ### in the same way at the beginning and at the end of
+        ### each axis, so we calculate the least common multiple
+        ### of the units dimensions
+
+        period_x = self.period_x = lcm(
+            *(grid.unit_rect.width for grid in grids)
+        )
+
+        period_y = self.period_y = lcm(
+            *(grid.unit_rect.height for grid in grids)
+        )
+
+        ### the tile is larger than the area by such multiples,
+        ### so we can offset the area we blit from the tile by
+        ### any amount up to them
+
+        width = area_rect.width + period_x
+        height = area_rect.height + period_y
+
+        tile = self.tile = Surface((width, height), SRCALPHA)
+        tile.fill((0, 0, 0, 0))
+
+        ### draw the lines of each grid
+
+        for grid in grids:
+
+            unit_width, unit_height = grid.unit_rect.size
+
+            for x in range(0, width, unit_width):
+
+                draw_line(
+                    tile,
+                    grid.color,
+                    (x, 0),
+                    (x, height - 1),
+                    grid.line_width,
+                )
+
+            for y in range(0, height, unit_height):
+
+                draw_line(
+                    tile,
+                    grid.color,
+                    (0, y),
+                    (width - 1, y),
+                    grid.line_width,
+                )
+
+        ### area of the tile to be blit
+
+        self.tile_area = Rect(0, 0, *area_rect.size)
+
+    def draw(self):
+        """Blit the tile area corresponding to the grids' scrolling."""
+
+        scrolling_x, scrolling_y = self.grids[0].scrolling
+
+        tile_area = self.tile_area
+
+        tile_area.topleft = (
+            self.period_x - (scrolling_x % self.period_x),
+            self.period_y - (scrolling_y % self.period_y),
+        )
+
+        self.screen.blit(self.tile, self.area_rect, tile_area)
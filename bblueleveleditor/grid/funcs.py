@@ -233,8 +233,10 @@ def move_grid_lines_along_axis(
 
     if axis_name == "x":
         length_attr = "width"
+        index = 0
     elif axis_name == "y":
         length_attr = "height"
+        index = 1
     else:
         raise ValueError("axis_name must be 'x' or 'y'.")
 
@@ -254,28 +256,32 @@ def move_grid_lines_along_axis(
         amount = d % -u if -d >= u else d
 
     ### for each in each line, perform movement;
-    ### also perform offsets if needed.
+    ### also perform offsets if needed;
+    ###
+    ### the value in the axis is accessed by index rather than by
+    ### attribute name, since it is faster
+
     for line in lines:
         for vector in line:
+
             ## perform movement
-            v = getattr(vector, axis_name)  # v 'means' value
-            setattr(vector, axis_name, v + amount)
+            v = vector[index] + amount  # v 'means' value
 
             ## perform offset if needed
 
-            v = getattr(vector, axis_name)
-
             # if vector reaches or surpasses the edge of
             # the total length, move it back by one total
             # length
             if v >= t:
-                setattr(vector, axis_name, v + -t)
+                v -= t
 
             # if, on the contrary, vector goes back beyond
             # the origin, move it forward by one total
             # length
             elif v < 0:
-                setattr(vector, axis_name, v + t)
+                v += t
+
+            vector[index] = v
 
 
 def get_grid_rects(pos, scroll_x, scroll_y, unit_rect):
@@ -0,0 +1,351 @@
+"""Facility for recording the input of sessions and replaying them.
+
+A recording is a file with a sequence of marshal-encoded items:
+
+1. a header, a dict with the contents of the level file (and of its
+   journal, if any) at the start of the session, so the session can be
+   replayed from the same level regardless of later edits;
+2. the input of each frame, a (mouse_pos, scroll_states, events) tuple,
+   where scroll_states are the pressed states of the scrolling keys
+   and events are (type, attributes) pairs;
+3. a trailer, a dict with the number of frames and a digest of the
+   level data at the end of the session (missing if the app didn't quit
+   normally).
+
+Replaying a recording feeds the input of each frame through the same
+code the app runs every frame, but without waiting between frames and
+without a window (SDL's dummy video driver is used), timing each frame
+and checking whether the resulting level data matches the recorded
+one. It must be done before the app is imported, since importing it
+loads the level.
+
+From the command line:
+
+    python -m bblueleveleditor --record session.rec
+    python -m bblueleveleditor --replay session.rec
+"""
+
+### standard library imports
+
+import os
+
+from marshal import dump, load
+
+from hashlib import sha1
+
+from pathlib import Path
+
+from statistics import mean, median
+
+from tempfile import TemporaryDirectory
+
+from time import perf_counter
+
+
+### third-party imports
+
+from pygame import (
+    QUIT,
+    MOUSEMOTION,
+    MOUSEBUTTONUP,
+    MOUSEBUTTONDOWN,
+    KEYDOWN,
+    K_ESCAPE,
+)
+
+from pygame.event import Event
+
+
+
+RECORDING_VERSION = 1
+
+### events handled by the app and the attributes it uses from them
+RECORDED_EVENT_TYPES = frozenset(
+    (QUIT, MOUSEMOTION, MOUSEBUTTONUP, MOUSEBUTTONDOWN, KEYDOWN)
+)
+
+EVENT_ATTR_NAMES = ('button', 'key', 'mod', 'pos')
+
+### number of slowest frames listed in the replay report
+SLOWEST_FRAME_COUNT = 5
+
+
+def get_level_digest(level_data):
+    """Return hex digest of level data.
+
+    The order of the objects in each layer doesn't affect the digest,
+    since it depends on the order in which objects were loaded.
+    """
+    items = sorted(
+        (key, repr(value))
+        for key, value in level_data.items()
+        if key != 'layered_objects'
+    )
+
+    objects = sorted(
+        (layer_name, repr(obj_data))
+        for layer_name, objs in level_data['layered_objects'].items()
+        for obj_data in objs
+    )
+
+    return sha1(repr((items, objects)).encode('utf-8')).hexdigest()
+
+
+class InputRecorder:
+    """Writer of recordings, fed with the input of each frame."""
+
+    def __init__(self, filepath, level_path, journal_path):
+
+        self.frame_count = 0
+
+        self.file = open(str(filepath), mode='wb')
+
+        dump(
+            {
+                'version': RECORDING_VERSION,
+                'level_name': level_path.name,
+                'level_bytes': read_bytes_if_any(level_path),
+                'journal_name': journal_path.name,
+                'journal_bytes': read_bytes_if_any(journal_path),
+            },
+            self.file,
+        )
+
+    def write_frame(self, events, scroll_states, mouse_pos):
+        """Write input of frame."""
+
+        dump(
+            (
+                tuple(map(int, mouse_pos)),
+                tuple(map(bool, scroll_states)),
+                tuple(
+                    (
+                        event.type,
+                        {
+                            name: (
+                                tuple(map(int, value))
+                                if name == 'pos'
+                                else int(value)
+                            )
+                            for name, value in event.dict.items()
+                            if name in EVENT_ATTR_NAMES
+                        },
+                    )
+                    for event in events
+                    if event.type in RECORDED_EVENT_TYPES
+                ),
+            ),
+            self.file,
+        )
+
+        self.frame_count += 1
+
+    def close(self, level_data):
+        """Write trailer with digest of given level data and close file."""
+
+        dump(
+            {
+                'frame_count': self.frame_count,
+                'level_digest': get_level_digest(level_data),
+            },
+            self.file,
+        )
+
+        self.file.close()
+
+
+def read_bytes_if_any(path):
+
+    try:
+        return path.read_bytes()
+
+    except FileNotFoundError:
+        return None
+
+
+def read_recording(filepath):
+    """Return header, list of frames and trailer (or None) of recording."""
+
+    frames = []
+    trailer = None
+
+    with open(str(filepath), mode='rb') as f:
+
+        try:
+            header = load(f)
+
+        except (EOFError, ValueError, TypeError):
+            header = None
+
+        if (
+            type(header) is not dict
+            or header.get('version') != RECORDING_VERSION
+        ):
+            raise ValueError(f"{filepath} isn't a supported recording.")
+
+        while True:
+
+            try:
+                item = load(f)
+
+            ## a recording interrupted while writing a frame ends with
+            ## a partial item
+            except (EOFError, ValueError, TypeError):
+                break
+
+            if type(item) is dict:
+
+                trailer = item
+                break
+
+            frames.append(item)
+
+    return header, frames, trailer
+
+
+class InputPlayer:
+    """Provider of the input of recorded frames, replacing the real one.
+
+    Events that would quit the app are left out, since the replay ends
+    with the recording.
+    """
+
+    def __init__(self):
+
+        self.mouse_pos = (0, 0)
+        self.scroll_states = (False,) * 4
+        self.events = []
+
+    def load_frame(self, frame):
+
+        self.mouse_pos, self.scroll_states, events = frame
+
+        self.events = [
+
+            Event(event_type, attrs)
+
+            for event_type, attrs in events
+
+            if event_type != QUIT
+            and not (event_type == KEYDOWN and attrs['key'] == K_ESCAPE)
+
+        ]
+
+    def get_inputs(self):
+        return self.events, self.scroll_states
+
+    def get_mouse_pos(self):
+        return self.mouse_pos
+
+
+def replay_recording(filepath):
+    """Replay recording headlessly, reporting timing and level check.
+
+    Returns True if the level data resulting from the replay matches the
+    recorded one (or if the recording has no digest to check against).
+    """
+    header, frames, trailer = read_recording(filepath)
+
+    with TemporaryDirectory() as dirname:
+
+        ### recreate the level (and journal) the session started with in
+        ### a temporary folder and point the app to it, so the replay
+        ### doesn't touch the actual levels and cache folders
+
+        levels_dir = Path(dirname)
+
+        for key in ('level', 'journal'):
+
+            data = header[key + '_bytes']
+
+            if data is not None:
+                (levels_dir / header[key + '_name']).write_bytes(data)
+
+        from . import config
+
+        config.LEVELS_DIR = levels_dir
+        config.CACHE_DIR = levels_dir / 'cache'
+
+        config.CACHE_DIR.mkdir()
+
+        os.environ['SDL_VIDEODRIVER'] = 'dummy'
+
+        from . import app
+
+        ### replace the input of the app and run the same code the
+        ### mainloop runs every frame, save for the waiting
+
+        player = InputPlayer()
+
+        app.REFS.get_inputs = player.get_inputs
+        app.REFS.get_mouse_pos = player.get_mouse_pos
+
+        app.init_view()
+
+        control = app.control
+        update_app = app.update_app
+        refs = app.REFS
+
+        durations = []
+
+        for frame in frames:
+
+            player.load_frame(frame)
+
+            start = perf_counter()
+
+            control()
+            update_app()
+            refs.draw()
+
+            durations.append((perf_counter() - start) * 1000)
+
+        app.wait_for_saving()
+
+        digest = get_level_digest(app.get_level_data())
+
+        app.LEVEL.close()
+
+    ### report
+
+    print(f"Replayed {len(frames)} frames of {Path(filepath).name}.")
+
+    if durations:
+
+        print(
+            f"Total: {sum(durations):.1f} ms"
+            f" | per frame: mean {mean(durations):.2f} ms,"
+            f" median {median(durations):.2f} ms,"
+            f" max {max(durations):.2f} ms"
+        )
+
+        slowest = sorted(
+            range(len(durations)),
+            key=durations.__getitem__,
+            reverse=True,
+        )[:SLOWEST_FRAME_COUNT]
+
+        print(
+            "Slowest frames: "
+            + ", ".join(
+                f"#{index} ({durations[index]:.2f} ms)"
+                for index in slowest
+            )
+        )
+
+    if trailer is None:
+
+        print(
+            "Recording has no level digest (the session didn't end"
+            " normally), so the resulting level wasn't checked."
+        )
+
+        return True
+
+    if digest == trailer['level_digest']:
+
+        print("Resulting level data matches the recorded session.")
+        return True
+
+    print("Resulting level data DOESN'T match the recorded session.")
+    return False
@@ -0,0 +1,125 @@
+"""Facility for journaling edits made to a level.
+
+Each edit is appended to the journal file as a line with the repr of
+a (kind, layer_name, obj_data) tuple, where kind is either 'add' or
+'remove' and obj_data is a dict describing the object as stored in
+level files.
+
+Since edits are written as soon as they are made, replaying them on
+top of the level file recovers work lost when the app doesn't quit
+normally. Once saved in the level file, the edits are dropped from the
+journal.
+"""
+
+### standard library imports
+
+from ast import literal_eval
+
+from os import replace
+
+from pathlib import Path
+
+
+
+class EditJournal:
+    """Append-only journal of level edits."""
+
+    def __init__(self, filepath):
+
+        self.filepath = Path(filepath)
+
+        ### file opened for appending, only opened once needed
+        self.file = None
+
+        ### number of records and bytes in the journal file
+        self.count = 0
+        self.size = 0
+
+    def read_records(self):
+        """Return list of records in journal file, if any.
+
+        A record partially written when the app stopped unexpectedly
+        is dropped from the file.
+        """
+        try:
+            data = self.filepath.read_bytes()
+
+        except FileNotFoundError:
+            return []
+
+        records = []
+
+        size = 0
+
+        for line in data.splitlines(keepends=True):
+
+            if not line.endswith(b'\n'):
+                break
+
+            try:
+                record = literal_eval(line.decode('utf-8'))
+
+            except (SyntaxError, ValueError, UnicodeDecodeError):
+                break
+
+            records.append(record)
+            size += len(line)
+
+        if size < len(data):
+
+            with open(str(self.filepath), mode='r+b') as f:
+                f.truncate(size)
+
+        self.count = len(records)
+        self.size = size
+
+        return records
+
+    def append(self, record):
+        """Write record at the end of the journal."""
+
+        if self.file is None:
+            self.file = open(str(self.filepath), mode='ab')
+
+        line = (repr(record) + '\n').encode('utf-8')
+
+        self.file.write(line)
+        self.file.flush()
+
+        self.count += 1
+        self.size += len(line)
+
+    def get_mark(self):
+        """Return (size, count) pair marking the current journal end."""
+        return self.size, self.count
+
+    def drop_until(self, mark):
+        """Drop records written before mark, keeping the ones after it.
+
+        The remaining records are written to a temporary file which
+        then replaces the journal file.
+        """
+        size, count = mark
+
+        if self.file is not None:
+
+            self.file.close()
+            self.file = None
+
+        if self.size > size:
+
+            with open(str(self.filepath), mode='rb') as f:
+
+                f.seek(size)
+                data = f.read()
+
+            temp_path = self.filepath.with_name(self.filepath.name + '.tmp')
+            temp_path.write_bytes(data)
+
+            replace(temp_path, self.filepath)
+
+        else:
+            self.filepath.unlink(missing_ok=True)
+
+        self.size -= size
+        self.count -= count
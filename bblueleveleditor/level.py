@@ -0,0 +1,1065 @@
+"""Headless model of levels: objects grouped in chunks, edits and saving.
+
+A Level holds the objects of a level file in an object store and groups
+them in level chunks, which can be edited (edits are journaled beside
+the level file) and saved back. Nothing here depends on pygame, so this
+module is imported in a few milliseconds and levels can be loaded,
+edited and saved by batch tools without a display.
+
+The app is a layer on top of it, which keeps track of the chunks near
+the camera and draws their objects; it reacts to changes in the level
+through the routines a Level calls when a chunk is edited or unloaded
+and when the object store is compacted (see Level.__init__()).
+
+Chunks are kept in a map keyed by the (column, row) of the cell each
+chunk occupies in an imaginary table of chunk-sized cells whose topleft
+is the content origin (the topleft of the topleftmost object), so the
+chunks in an area, or the chunk owning a position, are found without
+visiting every chunk.
+
+Rects are (x, y, width, height) tuples (pygame.Rect instances work as
+well, wherever rects are received).
+"""
+
+### standard library imports
+
+from os import replace
+
+from pathlib import Path
+
+
+### local imports
+
+from .objectstore import ObjectStore, LAYER_NAMES
+
+from .levelformat import (
+    LvlbReader,
+    save_lvlb,
+    append_lvlb,
+    DEFAULT_CHUNK_SIZE,
+)
+
+from .journal import EditJournal
+
+from .ourstdlibs.pyl import load_pyl, save_pyl_cache, get_cache_path
+
+
+
+### size of the cells of the grid used by each chunk to index its
+### objects by the points they cover
+POINT_CELL_SIZE = 32
+
+
+def do_nothing(*args): pass
+
+
+def find_level_path(levels_dir):
+    """Return path of level file in levels_dir.
+
+    Levels can be stored either as .lvl files (python literals) or as
+    .lvlb files (binary format), the latter being preferred if both are
+    present. If there's no level file, the path of a new .lvl file is
+    returned.
+    """
+    return next(
+        (
+            path
+            for suffix in ('.lvlb', '.lvl')
+            for path in sorted(levels_dir.iterdir())
+            if path.suffix == suffix
+        ),
+        levels_dir / 'level.lvl',
+    )
+
+
+def colliderect(rect, other):
+    """Return whether rects overlap, as pygame.Rect.colliderect()."""
+
+    x, y, width, height = rect
+    other_x, other_y, other_width, other_height = other
+
+    return (
+        x < other_x + other_width
+        and other_x < x + width
+        and y < other_y + other_height
+        and other_y < y + height
+    )
+
+
+
+class LevelChunk:
+
+    def __init__(self, level, rect, objs, sections=None):
+
+        self.level = level
+
+        ### store rect and ids of objs
+        self.rect = tuple(rect)
+        self.objs = objs
+
+        ### sections of the level file holding the chunk's objects, a
+        ### map of layer names to (offset, count) pairs; it is None if
+        ### the chunk doesn't come from a level file we read on demand,
+        ### in which case its objects are always loaded
+
+        self.sections = sections
+        self.is_loaded = sections is None
+
+        ### number of times objects were added/removed and value it had
+        ### when the chunk's objects were last saved (or read from the
+        ### level file); while they differ the chunk can't be unloaded
+
+        self.edit_count = 0
+        self.saved_edit_count = 0
+
+        ### create and store layers
+
+        for layer_name in LAYER_NAMES:
+            setattr(self, layer_name, set())
+
+        ### iterate over objects, storing them in layers
+
+        get_layer_name = level.store.get_layer_name
+
+        for obj_id in objs:
+            getattr(self, get_layer_name(obj_id)).add(obj_id)
+
+        ### point index, mapping (column, row) cells of a grid to lists
+        ### of ids of objects touching them; it is only created once
+        ### we need to query objects at a point
+        self.point_cells = None
+
+    @property
+    def is_modified(self):
+        return self.edit_count != self.saved_edit_count
+
+    def load(self):
+        """Read objects of chunk from level file into the store."""
+
+        level = self.level
+        reader = level.reader
+
+        add_obj = level.store.add
+        asset_names = reader.asset_names
+
+        for layer_name, (offset, count) in self.sections.items():
+
+            layer = getattr(self, layer_name)
+
+            for asset_id, has_size, x, y, width, height in (
+                reader.iter_records(offset, count)
+            ):
+
+                layer.add(
+                    add_obj(
+                        asset_names[asset_id],
+                        layer_name,
+                        (x, y),
+                        (width, height) if has_size else None,
+                    )
+                )
+
+            self.objs.update(layer)
+
+        self.is_loaded = True
+        level.loaded_chunks.add(self)
+
+    def unload(self):
+        """Drop objects of chunk from the store.
+
+        They can be read again from the level file with load().
+        """
+        level = self.level
+
+        remove_obj = level.store.remove
+
+        for obj_id in self.objs:
+            remove_obj(obj_id)
+
+        self.objs.clear()
+
+        for layer_name in LAYER_NAMES:
+            getattr(self, layer_name).clear()
+
+        self.point_cells = None
+
+        self.is_loaded = False
+        level.loaded_chunks.discard(self)
+
+        level.on_unload(self)
+
+    def add_obj(self, obj_id):
+
+        level = self.level
+
+        layer_name = level.store.get_layer_name(obj_id)
+
+        self.edit_count += 1
+
+        self.objs.add(obj_id)
+
+        getattr(self, layer_name).add(obj_id)
+
+        if self.point_cells is not None:
+
+            point_cells = self.point_cells
+
+            for cell in level.get_point_cells_touching(obj_id):
+                point_cells.setdefault(cell, []).append(obj_id)
+
+        level.on_edit(self, layer_name, obj_id)
+
+    def remove_obj(self, obj_id):
+
+        level = self.level
+
+        layer_name = level.store.get_layer_name(obj_id)
+
+        self.edit_count += 1
+
+        self.objs.remove(obj_id)
+        getattr(self, layer_name).remove(obj_id)
+
+        if self.point_cells is not None:
+
+            point_cells = self.point_cells
+
+            for cell in level.get_point_cells_touching(obj_id):
+                point_cells[cell].remove(obj_id)
+
+        level.on_edit(self, layer_name, obj_id)
+
+    def get_objs_at(self, x, y):
+        """Return list of ids of objects colliding with point."""
+
+        level = self.level
+
+        if self.point_cells is None:
+
+            point_cells = self.point_cells = {}
+
+            get_point_cells_touching = level.get_point_cells_touching
+
+            for obj_id in self.objs:
+
+                for cell in get_point_cells_touching(obj_id):
+                    point_cells.setdefault(cell, []).append(obj_id)
+
+        store = level.store
+
+        xs = store.xs
+        ys = store.ys
+        widths = store.widths
+        heights = store.heights
+
+        return [
+
+            obj_id
+
+            for obj_id in self.point_cells.get(
+                (x // POINT_CELL_SIZE, y // POINT_CELL_SIZE),
+                (),
+            )
+
+            if (
+                xs[obj_id] <= x < xs[obj_id] + widths[obj_id]
+                and ys[obj_id] <= y < ys[obj_id] + heights[obj_id]
+            )
+
+        ]
+
+
+class Level:
+    """Objects of a level file, grouped in chunks, plus its other data."""
+
+    def __init__(self, path, asset_specs, chunk_size=DEFAULT_CHUNK_SIZE):
+        """Read level data from file in path, if it exists.
+
+        path
+            Path or string, path of the .lvl or .lvlb level file.
+        asset_specs
+            Map of asset names to (pos_name, size, is_seamless) tuples,
+            as returned by assets.load_asset_specs().
+        chunk_size
+            Integer pair, size of the level chunks.
+
+        Only the level data other than the objects is read here; use
+        load_objects() to load them (and replay_journal() to reapply
+        edits not saved yet).
+        """
+        self.path = path = Path(path)
+
+        self.chunk_width, self.chunk_height = self.chunk_size = chunk_size
+
+        ### routines called when a chunk is edited, as
+        ### on_edit(chunk, layer_name, obj_id), when a chunk is unloaded,
+        ### as on_unload(chunk), and when the object store is compacted,
+        ### as on_compact(remap) (see ObjectStore.compact())
+
+        self.on_edit = do_nothing
+        self.on_unload = do_nothing
+        self.on_compact = do_nothing
+
+        ### object store
+
+        self.store = ObjectStore(LAYER_NAMES)
+
+        for asset_name, (pos_name, size, is_seamless) in (
+            asset_specs.items()
+        ):
+
+            self.store.register_asset(
+                asset_name,
+                pos_name,
+                size,
+                is_seamless,
+            )
+
+        ### map of (column, row) cells to chunks in them
+        self.chunks = {}
+
+        ### chunks whose objects were read on demand from the level file;
+        ### they can be unloaded, that is, their objects dropped from
+        ### memory until needed again (see unload_chunks_outside())
+        self.loaded_chunks = set()
+
+        ### topleft of the first cell of the table of chunks
+        self.origin = (0, 0)
+
+        ### read level data; for .lvlb files, only the level data other
+        ### than the objects is read now, the objects being read from
+        ### the sections of the file as they are needed
+
+        self.reader = None
+
+        if not path.exists():
+            self.data = {'layered_objects': {}}
+
+        elif path.suffix == '.lvlb':
+
+            self.reader = LvlbReader(path)
+            self.data = self.reader.extra_data
+
+        else:
+            self.data = load_pyl(path, use_cache=True)
+
+        ### journal of edits not saved in the level file yet, beside it
+        self.journal = EditJournal(path.with_name(path.name + '.journal'))
+
+        ### data about the save in progress, if any (see begin_save())
+
+        self.save_temp_path = None
+        self.journal_mark = None
+        self.snapshot_edit_counts = None
+
+    ### loading
+
+    def load_objects(self):
+        """Store objects from level data and group them in chunks.
+
+        If the level is a .lvlb file with chunks of our size, only its
+        chunk index is read, the objects being read on demand.
+        """
+        if self.reader is not None:
+            self.load_lvlb_objects()
+
+        else:
+            self.load_lvl_objects()
+
+    def load_lvl_objects(self):
+        """Store objects from level data and group them in chunks.
+
+        Each object is grouped in the chunk of the cell containing its
+        topleft, in a single pass over the objects.
+        """
+        store = self.store
+
+        ### move all objects from the level data to the store
+        store.load_layered_objects(self.data.pop('layered_objects'))
+
+        ### the topleft of the union of all objects' rects is the
+        ### content origin
+        self.origin = store.get_origin()
+
+        ### assign each object to the cell containing its topleft, which
+        ### is the first cell colliding with it in the table of cells,
+        ### creating a chunk for each cell with objects
+
+        chunks = self.chunks
+
+        for cell, obj_ids in store.group_by_cell(
+            self.origin,
+            self.chunk_size,
+        ).items():
+            chunks[cell] = LevelChunk(self, self.get_chunk_rect(cell), obj_ids)
+
+    def load_lvlb_objects(self):
+        """Index chunks from .lvlb file, to read their objects on demand."""
+
+        reader = self.reader
+
+        ### if the chunks in the file have a different size than ours,
+        ### we can't use its grouping, so we load the objects as though
+        ### they came from a .lvl file and close it
+
+        if reader.chunk_size != self.chunk_size:
+
+            self.data['layered_objects'] = reader.get_layered_objects()
+
+            reader.close()
+            self.reader = None
+
+            self.load_lvl_objects()
+            return
+
+        ###
+
+        self.origin = reader.origin
+        self.index_chunk_sections()
+
+    def index_chunk_sections(self):
+        """Assign sections in level file to chunks, creating missing ones."""
+
+        reader = self.reader
+        layer_names = reader.layer_names
+
+        chunks = self.chunks
+
+        for chunk in chunks.values():
+            chunk.sections = {}
+
+        for cell, layer_id, offset, count in reader.index:
+
+            chunk = chunks.get(cell)
+
+            if chunk is None:
+
+                chunk = chunks[cell] = LevelChunk(
+                    self,
+                    self.get_chunk_rect(cell),
+                    set(),
+                    {},
+                )
+
+            chunk.sections[layer_names[layer_id]] = (offset, count)
+
+        for chunk in chunks.values():
+
+            if chunk.is_loaded:
+                self.loaded_chunks.add(chunk)
+
+    def load_all_chunks(self):
+        """Load objects of all chunks not loaded yet."""
+
+        for chunk in self.chunks.values():
+
+            if not chunk.is_loaded:
+                chunk.load()
+
+    def unload_chunks_outside(self, rect):
+        """Unload unmodified chunks not colliding with rect.
+
+        Modified chunks are kept until saved, since their objects aren't
+        in the level file.
+
+        Once removed objects (including the ones of unloaded chunks)
+        outnumber the live ones in the store, it is also compacted; since
+        that takes time proportional to the size of the store, doing it
+        only then keeps its cost per removed object constant.
+        """
+        loaded_chunks = self.loaded_chunks
+
+        for chunk in [
+            chunk
+            for chunk in loaded_chunks
+            if not chunk.is_modified and not colliderect(chunk.rect, rect)
+        ]:
+            chunk.unload()
+
+        if self.store.removed_count > len(self.store):
+            self.compact()
+
+    def get_data(self):
+        """Return level data with objects from the store."""
+
+        self.load_all_chunks()
+
+        return {
+            **self.data,
+            'layered_objects': self.store.get_layered_objects(),
+        }
+
+    ### cells
+
+    def get_cell(self, x, y):
+        """Return (column, row) of cell containing point."""
+
+        origin_x, origin_y = self.origin
+
+        return (
+            int((x - origin_x) // self.chunk_width),
+            int((y - origin_y) // self.chunk_height),
+        )
+
+    def get_chunk_rect(self, cell):
+        """Return rect of chunk in given (column, row) cell."""
+
+        col, row = cell
+        origin_x, origin_y = self.origin
+
+        return (
+            origin_x + col * self.chunk_width,
+            origin_y + row * self.chunk_height,
+            self.chunk_width,
+            self.chunk_height,
+        )
+
+    def get_cells_touching(self, rect):
+        """Return (column, row) of cells colliding with rect.
+
+        Since cells have no gaps between them, colliding cells are the
+        ones between the cells of the rect's topleft and bottomright
+        corners, inclusive (the bottomright corner is subtracted by one
+        because it lies outside the rect, as with pygame.Rect.colliderect).
+        """
+        x, y, width, height = rect
+
+        first_col, first_row = self.get_cell(x, y)
+        last_col, last_row = self.get_cell(x + width - 1, y + height - 1)
+
+        return [
+            (col, row)
+            for row in range(first_row, last_row + 1)
+            for col in range(first_col, last_col + 1)
+        ]
+
+    def get_point_cells_touching(self, obj_id):
+        """Return (column, row) cells of point index touching object."""
+
+        x, y, width, height = self.store.get_rect(obj_id)
+
+        return [
+            (col, row)
+            for row in range(
+                y // POINT_CELL_SIZE,
+                (y + height - 1) // POINT_CELL_SIZE + 1,
+            )
+            for col in range(
+                x // POINT_CELL_SIZE,
+                (x + width - 1) // POINT_CELL_SIZE + 1,
+            )
+        ]
+
+    ### editing
+
+    def add(self, asset_name, layer_name, pos, size=None):
+        """Add object to level, journaling it.
+
+        Returns the id of the object and the chunk it was added to.
+        """
+        obj_id = self.store.add(asset_name, layer_name, pos, size)
+
+        chunk = self.add_to_chunk(obj_id)
+        self.journal_edit('add', obj_id)
+
+        return obj_id, chunk
+
+    def add_to_chunk(self, obj_id):
+        """Add object to chunk colliding with it or to a new one.
+
+        Returns the chunk.
+        """
+        chunks = self.chunks
+
+        rect = self.store.get_rect(obj_id)
+
+        ### if an existing chunk collides add obj to that chunk
+
+        for cell in self.get_cells_touching(rect):
+
+            chunk = chunks.get(cell)
+
+            if chunk is not None:
+
+                if not chunk.is_loaded:
+                    chunk.load()
+
+                break
+
+        ### otherwise create a new chunk
+
+        else:
+
+            x, y, width, height = rect
+
+            cell = self.get_cell(x + width // 2, y + height // 2)
+
+            chunk = chunks[cell] = (
+                LevelChunk(self, self.get_chunk_rect(cell), set())
+            )
+
+        chunk.add_obj(obj_id)
+
+        return chunk
+
+    def remove(self, chunk, obj_id):
+        """Remove object from chunk and level, journaling it."""
+
+        chunk.remove_obj(obj_id)
+
+        self.journal_edit('remove', obj_id)
+        self.store.remove(obj_id)
+
+    def journal_edit(self, kind, obj_id):
+        """Append edit of given kind ('add' or 'remove') to journal."""
+
+        store = self.store
+
+        self.journal.append(
+            (kind, store.get_layer_name(obj_id), store.get_obj_data(obj_id))
+        )
+
+    def replay_journal(self):
+        """Reapply edits from the journal on top of the loaded level.
+
+        Returns the number of edits replayed.
+        """
+        store = self.store
+        chunks = self.chunks
+
+        records = self.journal.read_records()
+
+        for kind, layer_name, obj_data in records:
+
+            asset_name = obj_data['name']
+            pos = obj_data['pos']
+            size = obj_data.get('size')
+
+            rect = store.get_data_rect(asset_name, pos, size)
+
+            ## the object is looked for among the ones in the chunks
+            ## touching its rect, so their objects must be loaded
+
+            touching_chunks = [
+                chunks[cell]
+                for cell in self.get_cells_touching(rect)
+                if cell in chunks
+            ]
+
+            for chunk in touching_chunks:
+
+                if not chunk.is_loaded:
+                    chunk.load()
+
+            if kind == 'add':
+
+                ## if the app was closed after the level file was saved
+                ## but before the saved edits were dropped from the
+                ## journal, the object may already be in the level; like
+                ## when adding objects in the app, it is skipped in that
+                ## case, so it isn't duplicated
+
+                is_seamless = store.asset_seamless_flags[
+                    store.asset_ids[asset_name]
+                ]
+
+                if (
+                    store.has_colliding_obj(asset_name, layer_name, rect)
+                    if is_seamless
+                    else store.has_obj_at(asset_name, layer_name, pos)
+                ):
+                    continue
+
+                self.add_to_chunk(store.add(asset_name, layer_name, pos, size))
+
+            else:
+
+                ## look for the object among the ones at the topleft of its
+                ## rect
+
+                x, y, _, _ = rect
+
+                for chunk in touching_chunks:
+
+                    obj_id = next(
+                        (
+                            obj_id
+                            for obj_id in chunk.get_objs_at(x, y)
+                            if store.get_layer_name(obj_id) == layer_name
+                            and store.get_obj_data(obj_id) == obj_data
+                        ),
+                        None,
+                    )
+
+                    if obj_id is not None:
+
+                        chunk.remove_obj(obj_id)
+                        store.remove(obj_id)
+
+                        break
+
+        return len(records)
+
+    def compact(self):
+        """Compact object store, updating ids referenced by the chunks."""
+
+        remap = self.store.compact()
+
+        for chunk in self.chunks.values():
+
+            for obj_ids in (
+                chunk.objs,
+                *(getattr(chunk, layer_name) for layer_name in LAYER_NAMES),
+            ):
+                new_ids = [remap[obj_id] for obj_id in obj_ids]
+                obj_ids.clear()
+                obj_ids.update(new_ids)
+
+            chunk.point_cells = None
+
+        self.on_compact(remap)
+
+    ### saving
+
+    def save(self):
+        """Save level in its file."""
+
+        write_level, args = self.begin_save()
+
+        try:
+            write_level(*args)
+
+        except Exception:
+
+            self.abort_save()
+            raise
+
+        self.end_save()
+
+    def begin_save(self):
+        """Snapshot level for saving it, returning (write_level, args).
+
+        Calling write_level(*args) writes the snapshot, so it can be
+        done on another thread, while the level keeps being edited; the
+        save must then be finished with end_save() (or abort_save(), if
+        writing fails).
+
+        The snapshot is written to a temporary file which replaces the
+        level file in end_save(). When possible, .lvlb files are updated
+        incrementally instead, by appending only the sections of modified
+        chunks to them.
+
+        Removed objects are kept in the snapshot (the writers skip them),
+        since compacting the store takes time proportional to its size
+        and would hold up the app; see unload_chunks_outside() instead.
+        """
+        ### snapshot level
+
+        path = self.path
+        store = self.store.copy()
+        extra_data = dict(self.data)
+
+        temp_path = path.with_name(path.name + '.tmp')
+
+        if path.suffix == '.lvlb' and self.can_append_to_file():
+
+            temp_path = None
+
+            write_level = write_lvlb_changes
+
+            ## only modified chunks (which are always loaded) are written,
+            ## while the index entries of the sections of other chunks are
+            ## kept
+
+            kept_index = []
+            chunk_snapshots = []
+
+            for (col, row), chunk in self.chunks.items():
+
+                if chunk.sections is None or chunk.is_modified:
+
+                    chunk_snapshots.append((
+                        (col, row),
+                        [
+                            tuple(getattr(chunk, layer_name))
+                            for layer_name in LAYER_NAMES
+                        ],
+                    ))
+
+                else:
+
+                    kept_index.extend(
+                        (
+                            col,
+                            row,
+                            LAYER_NAMES.index(layer_name),
+                            offset,
+                            count,
+                        )
+                        for layer_name, (offset, count)
+                        in chunk.sections.items()
+                    )
+
+            args = (
+                path,
+                extra_data,
+                store,
+                chunk_snapshots,
+                kept_index,
+                self.reader.asset_names,
+            )
+
+        elif path.suffix == '.lvlb':
+
+            write_level = write_lvlb_level
+
+            args = (
+                temp_path,
+                extra_data,
+                store,
+                [
+                    (
+                        cell,
+                        (
+                            [
+                                tuple(getattr(chunk, layer_name))
+                                for layer_name in LAYER_NAMES
+                            ]
+                            if chunk.is_loaded
+                            else None
+                        ),
+                        chunk.sections,
+                    )
+                    for cell, chunk in self.chunks.items()
+                ],
+                self.reader,
+                self.origin,
+                self.chunk_size,
+            )
+
+        else:
+
+            write_level = write_lvl_level
+            args = (temp_path, path, extra_data, store)
+
+        ### the journal mark tells which edits to drop from the journal and
+        ### the edit counts tell which chunks end up modified after saving
+
+        self.save_temp_path = temp_path
+        self.journal_mark = self.journal.get_mark()
+
+        self.snapshot_edit_counts = {
+            chunk: chunk.edit_count
+            for chunk in self.chunks.values()
+        }
+
+        return write_level, args
+
+    def can_append_to_file(self):
+        """Return whether .lvlb level file can be updated incrementally.
+
+        Its layers must match ours and the space left unused by previous
+        incremental updates must not exceed the space used, otherwise the
+        whole file is saved again.
+        """
+        reader = self.reader
+
+        return (
+            reader is not None
+            and tuple(reader.layer_names) == LAYER_NAMES
+            and reader.get_unused_size() * 2 <= len(reader.data)
+        )
+
+    def end_save(self):
+        """Replace level file with the saved one, reading its new index.
+
+        Only chunks edited after the snapshot remain modified.
+        """
+        path = self.path
+
+        ### replace level file, unless it was updated in place; the current
+        ### .lvlb file must be closed first, since it is memory-mapped
+
+        if self.reader is not None:
+            self.reader.close()
+
+        if self.save_temp_path is not None:
+            replace(self.save_temp_path, path)
+
+        if path.suffix == '.lvlb':
+
+            self.reader = LvlbReader(path)
+            self.index_chunk_sections()
+
+        ###
+
+        for chunk, edit_count in self.snapshot_edit_counts.items():
+            chunk.saved_edit_count = edit_count
+
+        self.journal.drop_until(self.journal_mark)
+
+        self.snapshot_edit_counts = None
+
+    def abort_save(self):
+        """Discard temporary file of failed save, if any."""
+
+        if self.save_temp_path is not None:
+            self.save_temp_path.unlink(missing_ok=True)
+
+        self.snapshot_edit_counts = None
+
+    def close(self):
+        """Close level file, if it is kept open (.lvlb files are)."""
+
+        if self.reader is not None:
+            self.reader.close()
+
+
+### functions writing snapshots of levels (see Level.begin_save())
+
+def write_lvl_level(filepath, level_path, extra_data, store):
+    """Write level in .lvl file, caching it for faster loading.
+
+    The file written is a temporary one which will replace the level
+    file in level_path, so the cache is written as the level file's
+    cache.
+    """
+    ## imported here, since importing pprint is slow compared to the
+    ## rest of this module, which is meant to be imported quickly
+    from pprint import pformat
+
+    level_data = {
+        **extra_data,
+        'layered_objects': store.get_layered_objects(),
+    }
+
+    filepath.write_text(pformat(level_data), encoding='utf-8')
+
+    save_pyl_cache(level_data, filepath, get_cache_path(level_path))
+
+def write_lvlb_level(
+    filepath,
+    extra_data,
+    store,
+    chunk_snapshots,
+    reader,
+    origin,
+    chunk_size,
+):
+    """Write level in .lvlb file, grouping objects as in the chunks.
+
+    chunk_snapshots
+        List of (cell, layers, sections) tuples, where layers is a list
+        with the ids of the objects in each layer of a loaded chunk or
+        None for chunks not loaded, whose objects are copied from their
+        sections in the current level file, read with the reader.
+    """
+    get_record = store.get_record
+
+    if reader is not None:
+
+        iter_records = reader.iter_records
+
+        asset_id_map = [
+            store.asset_ids[asset_name]
+            for asset_name in reader.asset_names
+        ]
+
+    def get_unloaded_records(sections, layer_name):
+
+        if layer_name not in sections:
+            return ()
+
+        return [
+            (asset_id_map[asset_id], *rest)
+            for asset_id, *rest in iter_records(*sections[layer_name])
+        ]
+
+    save_lvlb(
+        filepath,
+        extra_data,
+        store.asset_names,
+        store.layer_names,
+        (
+            (
+                cell,
+                layer_id,
+                (
+                    [
+                        get_record(obj_id)
+                        for obj_id in sorted(layers[layer_id])
+                    ]
+                    if layers is not None
+                    else get_unloaded_records(sections, layer_name)
+                ),
+            )
+            for cell, layers, sections in chunk_snapshots
+            for layer_id, layer_name in enumerate(LAYER_NAMES)
+        ),
+        origin,
+        chunk_size,
+    )
+
+def write_lvlb_changes(
+    filepath,
+    extra_data,
+    store,
+    chunk_snapshots,
+    kept_index,
+    file_asset_names,
+):
+    """Append sections of modified chunks to .lvlb level file.
+
+    chunk_snapshots
+        List of (cell, layers) pairs, where layers is a list with the
+        ids of the objects in each layer of a modified chunk.
+    kept_index
+        List of index entries of sections in the file to keep.
+    file_asset_names
+        List of asset names referenced by the kept sections; assets
+        not in it are added to the end of it.
+    """
+    asset_names = list(file_asset_names)
+
+    known_names = set(asset_names)
+
+    asset_names.extend(
+        asset_name
+        for asset_name in store.asset_names
+        if asset_name not in known_names
+    )
+
+    file_asset_ids = {
+        asset_name: asset_id
+        for asset_id, asset_name in enumerate(asset_names)
+    }
+
+    asset_id_map = [
+        file_asset_ids[asset_name]
+        for asset_name in store.asset_names
+    ]
+
+    get_record = store.get_record
+
+    append_lvlb(
+        filepath,
+        extra_data,
+        asset_names,
+        store.layer_names,
+        kept_index,
+        (
+            (
+                cell,
+                layer_id,
+                [
+                    (asset_id_map[asset_id], *rest)
+                    for asset_id, *rest in map(
+                        get_record,
+                        sorted(layers[layer_id]),
+                    )
+                ],
+            )
+            for cell, layers in chunk_snapshots
+            for layer_id in range(len(LAYER_NAMES))
+        ),
+    )
@@ -0,0 +1,501 @@
+"""Facility for loading/saving levels in the binary .lvlb format.
+
+The .lvlb format is an optional compact alternative to the .lvl
+format (a pretty-formatted python literal). It holds the same data,
+but the objects are stored as fixed-width records grouped in sections,
+one for each layer of each level chunk.
+
+Layout (all integers are little-endian):
+
+header
+    magic bytes (b'LVLB'), format version, offset and size of the
+    trailer, content origin (x, y) and chunk size (width, height);
+sections
+    fixed-width object records: asset id, whether the object has
+    its own size, position (x, y) and size (width, height; zero if the
+    object has no size of its own);
+trailer
+    level data other than the objects (utf-8 encoded python literal),
+    table of asset names, table of layer names and the chunk index,
+    that is, cell (column, row), layer id, offset and number of
+    records of each section.
+
+Since the chunk index is stored at the end of the file, we can load
+only the header and trailer and then read each section on demand.
+
+It also allows the file to be updated incrementally: new sections and
+a new trailer are appended and the header is changed to point to the
+new trailer, whose index references both new and existing sections.
+The space used by the replaced sections and trailer becomes unused
+until the whole file is saved again.
+
+Unlike saving the whole file, which is done in a temporary file that
+then replaces the level file, an incremental update changes the level
+file in place, so it isn't crash-atomic (see append_lvlb()).
+"""
+
+### standard library imports
+
+from os import fsync, SEEK_END
+
+from ast import literal_eval
+
+from mmap import mmap, ACCESS_READ
+
+from struct import Struct
+
+from pathlib import Path
+
+
+
+MAGIC = b'LVLB'
+VERSION = 1
+
+HEADER = Struct('<4sHxxQQiiii')
+RECORD = Struct('<HBxiiii')
+INDEX_ENTRY = Struct('<iiBxxxQI')
+COUNT = Struct('<I')
+NAME_LENGTH = Struct('<H')
+
+### chunk size used when converting .lvl files, the same as the size
+### of the vicinity in the app (three times the screen size)
+DEFAULT_CHUNK_SIZE = (960, 540)
+
+
+def save_lvlb(
+    filepath,
+    extra_data,
+    asset_names,
+    layer_names,
+    sections,
+    origin,
+    chunk_size,
+):
+    """Save level in the binary format in filepath.
+
+    extra_data
+        Dict with level data other than the objects.
+    asset_names, layer_names
+        Sequences of strings, the names referenced by the asset and
+        layer ids in the sections.
+    sections
+        Iterable of (cell, layer_id, records) tuples, where records
+        is an iterable of (asset_id, has_size, x, y, width, height)
+        tuples.
+    origin, chunk_size
+        Integer pairs, the content origin and the size of chunks used
+        to determine the cells.
+    """
+    with open(str(filepath), mode='wb') as f:
+
+        ### reserve space for header
+        f.write(bytes(HEADER.size))
+
+        ### write sections and trailer
+
+        index = write_sections(f, sections)
+
+        trailer_offset = f.tell()
+
+        trailer = get_trailer(extra_data, asset_names, layer_names, index)
+        f.write(trailer)
+
+        ### write header
+
+        f.seek(0)
+
+        f.write(HEADER.pack(
+            MAGIC, VERSION, trailer_offset, len(trailer), *origin, *chunk_size
+        ))
+
+def append_lvlb(
+    filepath,
+    extra_data,
+    asset_names,
+    layer_names,
+    kept_index,
+    sections,
+):
+    """Append sections to .lvlb file, with a new trailer.
+
+    kept_index
+        List of (column, row, layer_id, offset, count) entries of the
+        index of sections already in the file to keep.
+
+    The other arguments are the same as in save_lvlb(). The header is
+    only updated once the new sections and trailer are safely written,
+    so if writing them is interrupted the file keeps its previous
+    contents.
+
+    The header itself, though, is overwritten in place, in a single
+    write of a few dozen bytes at the start of the file, which is then
+    synced to disk. Storage devices usually write that much atomically,
+    but that's not guaranteed, so a crash or power loss during that
+    write may leave the file with a corrupted header. Thus, this update
+    isn't crash-atomic, unlike saving the whole file with save_lvlb()
+    in a temporary file which then replaces the level file.
+    """
+    with open(str(filepath), mode='r+b') as f:
+
+        (
+            magic,
+            version,
+            _,
+            _,
+            *values,
+        ) = HEADER.unpack(f.read(HEADER.size))
+
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{filepath} is not a .lvlb file.")
+
+        ### write sections and trailer at the end of the file
+
+        f.seek(0, SEEK_END)
+
+        index = kept_index + write_sections(f, sections)
+
+        trailer_offset = f.tell()
+
+        trailer = get_trailer(extra_data, asset_names, layer_names, index)
+        f.write(trailer)
+
+        f.flush()
+        fsync(f.fileno())
+
+        ### point header to new trailer
+
+        f.seek(0)
+
+        f.write(HEADER.pack(
+            MAGIC, VERSION, trailer_offset, len(trailer), *values
+        ))
+
+        f.flush()
+        fsync(f.fileno())
+
+def write_sections(f, sections):
+    """Write sections at current position of file, returning index.
+
+    sections
+        Iterable of (cell, layer_id, records) tuples, as in
+        save_lvlb(); empty sections aren't written.
+
+    The index is a list of (column, row, layer_id, offset, count)
+    entries, one for each section written.
+    """
+    index = []
+
+    pack_record = RECORD.pack
+
+    write = f.write
+    offset = f.tell()
+
+    for (col, row), layer_id, records in sections:
+
+        data = b''.join([pack_record(*record) for record in records])
+
+        if not data:
+            continue
+
+        write(data)
+
+        count = len(data) // RECORD.size
+
+        index.append((col, row, layer_id, offset, count))
+
+        offset += len(data)
+
+    return index
+
+def get_trailer(extra_data, asset_names, layer_names, index):
+    """Return bytes of the trailer."""
+
+    from pprint import pformat
+
+    parts = []
+
+    ### extra data
+    extra = pformat(extra_data).encode('utf-8')
+    parts.extend((COUNT.pack(len(extra)), extra))
+
+    ### name tables
+
+    for names in (asset_names, layer_names):
+
+        parts.append(COUNT.pack(len(names)))
+
+        for name in names:
+
+            encoded = name.encode('utf-8')
+            parts.extend((NAME_LENGTH.pack(len(encoded)), encoded))
+
+    ### chunk index
+
+    parts.append(COUNT.pack(len(index)))
+    parts.extend(INDEX_ENTRY.pack(*entry) for entry in index)
+
+    return b''.join(parts)
+
+
+class LvlbReader:
+    """Reader for .lvlb files, with sections read on demand.
+
+    The file is memory-mapped and only the header and trailer are
+    parsed upfront. Use it as a context manager or call close() once
+    done with it.
+    """
+
+    def __init__(self, filepath):
+
+        self.filepath = Path(filepath)
+
+        self.file = open(str(filepath), mode='rb')
+
+        try:
+            self.data = mmap(self.file.fileno(), 0, access=ACCESS_READ)
+
+        except ValueError:
+
+            ## empty files can't be memory-mapped
+            self.file.close()
+            raise ValueError(f"{filepath} is not a .lvlb file.")
+
+        data = self.data
+
+        (
+            magic,
+            version,
+            trailer_offset,
+            trailer_size,
+            *values,
+        ) = HEADER.unpack_from(data)
+
+        if magic != MAGIC or version != VERSION:
+
+            self.close()
+            raise ValueError(f"{filepath} is not a .lvlb file.")
+
+        self.origin = tuple(values[:2])
+        self.chunk_size = tuple(values[2:])
+
+        self.trailer_size = trailer_size
+
+        ### parse trailer
+
+        offset = trailer_offset
+
+        ## extra data
+
+        (length,) = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+
+        self.extra_data = literal_eval(
+            data[offset:offset+length].decode('utf-8')
+        )
+
+        offset += length
+
+        ## name tables
+
+        name_tables = []
+
+        for _ in range(2):
+
+            (count,) = COUNT.unpack_from(data, offset)
+            offset += COUNT.size
+
+            names = []
+
+            for _ in range(count):
+
+                (length,) = NAME_LENGTH.unpack_from(data, offset)
+                offset += NAME_LENGTH.size
+
+                names.append(data[offset:offset+length].decode('utf-8'))
+                offset += length
+
+            name_tables.append(names)
+
+        self.asset_names, self.layer_names = name_tables
+
+        ## chunk index, a list of (cell, layer_id, offset, count) tuples
+
+        (count,) = COUNT.unpack_from(data, offset)
+        offset += COUNT.size
+
+        self.index = [
+            ((col, row), layer_id, section_offset, record_count)
+            for col, row, layer_id, section_offset, record_count
+            in INDEX_ENTRY.iter_unpack(
+                data[offset:offset + count * INDEX_ENTRY.size]
+            )
+        ]
+
+    def get_unused_size(self):
+        """Return number of bytes not used by the current contents.
+
+        That is, the size of sections and trailers replaced when the
+        file was updated incrementally.
+        """
+        return (
+            len(self.data)
+            - HEADER.size
+            - self.trailer_size
+            - sum(count for *_, count in self.index) * RECORD.size
+        )
+
+    def iter_records(self, section_offset, record_count):
+        """Return iterator of records of section.
+
+        Records are (asset_id, has_size, x, y, width, height) tuples.
+        """
+        return RECORD.iter_unpack(
+            self.data[
+                section_offset:section_offset + record_count * RECORD.size
+            ]
+        )
+
+    def iter_sections(self):
+        """Yield (cell, layer_name, records) for each section."""
+
+        layer_names = self.layer_names
+
+        for cell, layer_id, section_offset, record_count in self.index:
+
+            yield (
+                cell,
+                layer_names[layer_id],
+                self.iter_records(section_offset, record_count),
+            )
+
+    def get_layered_objects(self):
+        """Return objects as layered objects as stored in .lvl files."""
+
+        layered_objects = {}
+
+        asset_names = self.asset_names
+
+        for _, layer_name, records in self.iter_sections():
+
+            obj_list = layered_objects.setdefault(layer_name, [])
+
+            for asset_id, has_size, x, y, width, height in records:
+
+                obj_data = {'name': asset_names[asset_id], 'pos': (x, y)}
+
+                if has_size:
+                    obj_data['size'] = (width, height)
+
+                obj_list.append(obj_data)
+
+        return layered_objects
+
+    def close(self):
+
+        self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def convert_lvlb_to_lvl(lvlb_path, lvl_path):
+    """Save .lvlb file contents as .lvl file."""
+    from pprint import pformat
+
+    with LvlbReader(lvlb_path) as reader:
+
+        level_data = {
+            **reader.extra_data,
+            'layered_objects': reader.get_layered_objects(),
+        }
+
+    Path(lvl_path).write_text(pformat(level_data), encoding='utf-8')
+
+
+def convert_lvl_to_lvlb(
+    lvl_path,
+    lvlb_path,
+    asset_specs,
+    chunk_size=DEFAULT_CHUNK_SIZE,
+):
+    """Save .lvl file contents as .lvlb file.
+
+    asset_specs
+        Map of asset names to (pos_name, size, is_seamless) tuples,
+        needed to know the area occupied by each object and thus
+        group them in chunks.
+    """
+    from .objectstore import ObjectStore
+
+    level_data = literal_eval(Path(lvl_path).read_text(encoding='utf-8'))
+
+    store = ObjectStore()
+
+    for asset_name, (pos_name, size, is_seamless) in asset_specs.items():
+        store.register_asset(asset_name, pos_name, size, is_seamless)
+
+    store.load_layered_objects(level_data.pop('layered_objects'))
+
+    origin = store.get_origin()
+
+    cell_objs = store.group_by_cell(origin, chunk_size)
+
+    get_record = store.get_record
+    layers = store.layers
+
+    save_lvlb(
+        lvlb_path,
+        level_data,
+        store.asset_names,
+        store.layer_names,
+        (
+            (
+                cell,
+                layer_id,
+                [
+                    get_record(obj_id)
+                    for obj_id in sorted(obj_ids)
+                    if layers[obj_id] == layer_id
+                ],
+            )
+            for cell, obj_ids in cell_objs.items()
+            for layer_id in range(len(store.layer_names))
+        ),
+        origin,
+        chunk_size,
+    )
+
+
+if __name__ == '__main__':
+
+    ### convert a level file between the .lvl and .lvlb formats, saving
+    ### the result beside it
+
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(
+        description="Convert level file between .lvl and .lvlb formats."
+    )
+
+    parser.add_argument('filepath', type=Path)
+
+    args = parser.parse_args()
+
+    filepath = args.filepath
+
+    if filepath.suffix == '.lvlb':
+        convert_lvlb_to_lvl(filepath, filepath.with_suffix('.lvl'))
+
+    else:
+
+        from .assets import load_asset_specs
+
+        convert_lvl_to_lvlb(
+            filepath,
+            filepath.with_suffix('.lvlb'),
+            load_asset_specs(),
+        )
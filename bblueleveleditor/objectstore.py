@@ -0,0 +1,584 @@
+"""Facility for compact storage of level objects."""
+
+### standard library imports
+
+from array import array
+
+from copy import copy
+
+
+
+### names of layers where objects are placed, in the order they are drawn
+
+LAYER_NAMES = (
+    'backprops',
+    'middleprops',
+    'blocks',
+    'actors',
+)
+
+
+### map of pos names (the names of the positional attributes of
+### pygame.Rect used to anchor objects) to the position of such anchor
+### relative to the topleft, in halves of the width and height
+###
+### that is, 0 means the left/top edge, 1 means the middle and 2 means
+### the right/bottom edge
+
+ANCHOR_HALVES = {
+    'topleft': (0, 0),
+    'midtop': (1, 0),
+    'topright': (2, 0),
+    'midleft': (0, 1),
+    'center': (1, 1),
+    'midright': (2, 1),
+    'bottomleft': (0, 2),
+    'midbottom': (1, 2),
+    'bottomright': (2, 2),
+}
+
+
+### names of the attributes holding the object arrays
+OBJ_ARRAY_NAMES = (
+    'assets',
+    'layers',
+    'sized',
+    'xs',
+    'ys',
+    'widths',
+    'heights',
+)
+
+
+### size of the cells of the grid used to index objects of seamless assets
+### by the area they occupy
+INDEX_CELL_SIZE = 128
+
+
+def get_anchor_offset(pos_name, width, height):
+    """Return offset from topleft of anchor of rect with given size.
+
+    Uses the same rounding as pygame.Rect, so that setting the
+    topleft of a rect to (x, y) positions its anchor at
+    (x + offset_x, y + offset_y).
+    """
+    half_x, half_y = ANCHOR_HALVES[pos_name]
+    return (width * half_x) // 2, (height * half_y) // 2
+
+
+class ObjectStore:
+    """Struct-of-arrays storage of level objects.
+
+    Rather than representing each object with its own dict and
+    instance, each attribute of the objects is stored in its own
+    array, and each object is represented by an integer id, its
+    index in the arrays.
+
+    Asset names are interned, that is, stored only once in a table,
+    with objects storing only the integer id of their asset.
+
+    Ids are stable: removing an object just marks it as removed
+    (we store -1 as its layer id), so the ids of the remaining
+    objects never change.
+
+    Objects are also indexed so we can quickly tell whether placing
+    a new object would duplicate an existing one: objects of regular
+    assets are counted by their anchor position, while objects of
+    seamless assets are stored in the cells of a grid touched by them.
+    """
+
+    def __init__(self, layer_names=LAYER_NAMES):
+        """Create empty tables and arrays.
+
+        layer_names
+            Iterable of strings, the names of the layers objects
+            can be stored in.
+        """
+        ### layer table
+
+        self.layer_names = tuple(layer_names)
+
+        self.layer_ids = {
+            layer_name: layer_id
+            for layer_id, layer_name in enumerate(self.layer_names)
+        }
+
+        ### asset table
+
+        self.asset_names = []
+        self.asset_ids = {}
+        self.asset_pos_names = []
+        self.asset_sizes = []
+        self.asset_seamless_flags = []
+
+        ### object arrays
+
+        ## ids of assets and layers
+        self.assets = array('H')
+        self.layers = array('b')
+
+        ## whether the object has its own size (seamless objects),
+        ## rather than the size of its asset
+        self.sized = array('b')
+
+        ## rect (topleft and size) of objects in the level
+        self.xs = array('i')
+        self.ys = array('i')
+        self.widths = array('i')
+        self.heights = array('i')
+
+        ### number of removed objects
+        self.removed_count = 0
+
+        ### indices
+
+        ## maps (asset id, layer id, x, y) of anchor positions of objects
+        ## of regular assets to the number of objects there
+        self.anchor_counts = {}
+
+        ## maps (asset id, layer id, column, row) cells to sets of ids
+        ## of objects of seamless assets touching them
+        self.area_cells = {}
+
+    def register_asset(self, asset_name, pos_name, size, is_seamless=False):
+        """Store asset data in the asset table, returning its id.
+
+        asset_name
+            String, the name of the asset.
+        pos_name
+            String, name of the pygame.Rect attribute to which the
+            position of objects of this asset is assigned.
+        size
+            Integer pair, the dimensions of the asset image.
+        is_seamless
+            Boolean, whether the asset is seamless, that is, whether
+            its objects can cover larger areas.
+        """
+        try:
+            return self.asset_ids[asset_name]
+
+        except KeyError:
+
+            asset_id = self.asset_ids[asset_name] = len(self.asset_names)
+
+            self.asset_names.append(asset_name)
+            self.asset_pos_names.append(pos_name)
+            self.asset_sizes.append(tuple(size))
+            self.asset_seamless_flags.append(is_seamless)
+
+            return asset_id
+
+    def __len__(self):
+        """Return number of objects stored (excluding removed ones)."""
+        return len(self.layers) - self.removed_count
+
+    def add(self, asset_name, layer_name, pos, size=None):
+        """Store new object and return its id.
+
+        asset_name
+            String, name of a registered asset.
+        layer_name
+            String, name of the layer where the object is.
+        pos
+            Integer pair, position of the object's anchor.
+        size
+            Either None, in which case the object has the size of
+            its asset, or an integer pair with the object's own size.
+        """
+        x, y, width, height = self.get_data_rect(asset_name, pos, size)
+
+        obj_id = len(self.layers)
+
+        self.assets.append(self.asset_ids[asset_name])
+        self.layers.append(self.layer_ids[layer_name])
+        self.sized.append(size is not None)
+        self.xs.append(x)
+        self.ys.append(y)
+        self.widths.append(width)
+        self.heights.append(height)
+
+        self.index(obj_id)
+
+        return obj_id
+
+    def get_data_rect(self, asset_name, pos, size=None):
+        """Return (x, y, width, height) of rect of object with given data.
+
+        The arguments are the same as in add().
+        """
+        asset_id = self.asset_ids[asset_name]
+
+        if size is None:
+            width, height = self.asset_sizes[asset_id]
+
+        else:
+            width, height = size
+
+        offset_x, offset_y = get_anchor_offset(
+            self.asset_pos_names[asset_id],
+            width,
+            height,
+        )
+
+        x, y = pos
+
+        return x - offset_x, y - offset_y, width, height
+
+    def remove(self, obj_id):
+        """Mark object as removed."""
+
+        self.unindex(obj_id)
+
+        self.layers[obj_id] = -1
+        self.removed_count += 1
+
+    def index(self, obj_id):
+        """Add object to the index appropriate for its asset."""
+
+        asset_id = self.assets[obj_id]
+
+        if self.asset_seamless_flags[asset_id]:
+            self.index_area(obj_id)
+
+        else:
+
+            key = (asset_id, self.layers[obj_id], *self.get_pos(obj_id))
+
+            anchor_counts = self.anchor_counts
+            anchor_counts[key] = anchor_counts.get(key, 0) + 1
+
+    def index_area(self, obj_id):
+        """Add object to the cells it touches in the area index."""
+
+        asset_id = self.assets[obj_id]
+        layer_id = self.layers[obj_id]
+
+        area_cells = self.area_cells
+
+        for cell in self.get_cells_touching(*self.get_rect(obj_id)):
+
+            key = (asset_id, layer_id, *cell)
+
+            try:
+                area_cells[key].add(obj_id)
+            except KeyError:
+                area_cells[key] = {obj_id}
+
+    def unindex(self, obj_id):
+        """Remove object from the index appropriate for its asset."""
+
+        asset_id = self.assets[obj_id]
+        layer_id = self.layers[obj_id]
+
+        if self.asset_seamless_flags[asset_id]:
+
+            area_cells = self.area_cells
+
+            for cell in self.get_cells_touching(*self.get_rect(obj_id)):
+
+                key = (asset_id, layer_id, *cell)
+
+                obj_ids = area_cells[key]
+                obj_ids.remove(obj_id)
+
+                if not obj_ids:
+                    del area_cells[key]
+
+        else:
+
+            key = (asset_id, layer_id, *self.get_pos(obj_id))
+
+            anchor_counts = self.anchor_counts
+
+            count = anchor_counts[key] - 1
+
+            if count:
+                anchor_counts[key] = count
+            else:
+                del anchor_counts[key]
+
+    @staticmethod
+    def get_cells_touching(x, y, width, height):
+        """Return (column, row) pairs of index cells touching rect."""
+
+        return [
+            (col, row)
+            for row in range(
+                y // INDEX_CELL_SIZE,
+                (y + height - 1) // INDEX_CELL_SIZE + 1,
+            )
+            for col in range(
+                x // INDEX_CELL_SIZE,
+                (x + width - 1) // INDEX_CELL_SIZE + 1,
+            )
+        ]
+
+    def has_obj_at(self, asset_name, layer_name, pos):
+        """Return whether there's object of regular asset at anchor pos."""
+
+        return (
+            self.asset_ids[asset_name],
+            self.layer_ids[layer_name],
+            *pos,
+        ) in self.anchor_counts
+
+    def has_colliding_obj(self, asset_name, layer_name, rect):
+        """Return whether object of seamless asset collides with rect.
+
+        rect
+            (x, y, width, height) tuple or equivalent.
+        """
+        asset_id = self.asset_ids[asset_name]
+        layer_id = self.layer_ids[layer_name]
+
+        x, y, width, height = rect
+
+        right = x + width
+        bottom = y + height
+
+        xs = self.xs
+        ys = self.ys
+        widths = self.widths
+        heights = self.heights
+
+        get_obj_ids = self.area_cells.get
+
+        for cell in self.get_cells_touching(x, y, width, height):
+
+            for obj_id in get_obj_ids((asset_id, layer_id, *cell), ()):
+
+                if (
+                    xs[obj_id] < right
+                    and xs[obj_id] + widths[obj_id] > x
+                    and ys[obj_id] < bottom
+                    and ys[obj_id] + heights[obj_id] > y
+                ):
+                    return True
+
+        return False
+
+    def compact(self):
+        """Drop removed objects from the arrays, changing ids.
+
+        The arrays are changed in place, so references to them remain
+        valid. Returns a list mapping the old ids to the new ones, with
+        -1 for removed objects.
+        """
+        layers = self.layers
+
+        remap = [-1] * len(layers)
+
+        live_ids = list(self.iter_ids())
+
+        for new_id, old_id in enumerate(live_ids):
+            remap[old_id] = new_id
+
+        for obj_array in (
+            getattr(self, attr_name)
+            for attr_name in OBJ_ARRAY_NAMES
+        ):
+            obj_array[:] = array(
+                obj_array.typecode,
+                [obj_array[obj_id] for obj_id in live_ids],
+            )
+
+        self.removed_count = 0
+
+        ### the area index references object ids, so we rebuild it
+
+        self.area_cells.clear()
+
+        asset_seamless_flags = self.asset_seamless_flags
+        assets = self.assets
+
+        for obj_id in range(len(layers)):
+
+            if asset_seamless_flags[assets[obj_id]]:
+                self.index_area(obj_id)
+
+        return remap
+
+    def clear(self):
+        """Remove all objects, keeping the asset and layer tables.
+
+        The arrays are emptied in place, so references to them remain
+        valid.
+        """
+        for attr_name in OBJ_ARRAY_NAMES:
+            del getattr(self, attr_name)[:]
+
+        self.removed_count = 0
+
+        self.anchor_counts.clear()
+        self.area_cells.clear()
+
+    def copy(self):
+        """Return copy of store with its own object arrays.
+
+        The copy shares the asset tables and has no indices, so it is
+        only meant for reading objects, for instance, to save them
+        while this store keeps being edited.
+        """
+        other = copy(self)
+
+        for attr_name in OBJ_ARRAY_NAMES:
+            setattr(other, attr_name, getattr(self, attr_name)[:])
+
+        other.anchor_counts = other.area_cells = None
+
+        return other
+
+    def iter_ids(self):
+        """Return iterator of ids of stored objects."""
+
+        return (
+            obj_id
+            for obj_id, layer_id in enumerate(self.layers)
+            if layer_id != -1
+        )
+
+    def get_asset_name(self, obj_id):
+        return self.asset_names[self.assets[obj_id]]
+
+    def get_layer_name(self, obj_id):
+        return self.layer_names[self.layers[obj_id]]
+
+    def get_rect(self, obj_id):
+        """Return (x, y, width, height) tuple of object's rect."""
+
+        return (
+            self.xs[obj_id],
+            self.ys[obj_id],
+            self.widths[obj_id],
+            self.heights[obj_id],
+        )
+
+    def get_pos(self, obj_id):
+        """Return position of object's anchor."""
+
+        width = self.widths[obj_id]
+        height = self.heights[obj_id]
+
+        offset_x, offset_y = get_anchor_offset(
+            self.asset_pos_names[self.assets[obj_id]],
+            width,
+            height,
+        )
+
+        return (self.xs[obj_id] + offset_x, self.ys[obj_id] + offset_y)
+
+    def get_obj_data(self, obj_id):
+        """Return object data as stored in level files."""
+
+        data = {
+            'name': self.asset_names[self.assets[obj_id]],
+            'pos': self.get_pos(obj_id),
+        }
+
+        if self.sized[obj_id]:
+            data['size'] = (self.widths[obj_id], self.heights[obj_id])
+
+        return data
+
+    def load_layered_objects(self, layered_objects):
+        """Store objects from layered objects as stored in level files.
+
+        layered_objects
+            Dict mapping layer names to lists of object data, that
+            is, dicts with 'name', 'pos' and, optionally, 'size' keys.
+        """
+        add = self.add
+
+        for layer_name, objs in layered_objects.items():
+
+            for obj_data in objs:
+
+                add(
+                    obj_data['name'],
+                    layer_name,
+                    obj_data['pos'],
+                    obj_data.get('size'),
+                )
+
+    def get_origin(self):
+        """Return topleft of union of objects' rects, or (0, 0) if empty."""
+
+        if not len(self):
+            return 0, 0
+
+        live_ids = list(self.iter_ids())
+
+        xs = self.xs
+        ys = self.ys
+
+        return (
+            min([xs[obj_id] for obj_id in live_ids]),
+            min([ys[obj_id] for obj_id in live_ids]),
+        )
+
+    def group_by_cell(self, origin, cell_size):
+        """Return map of cells to sets of ids of objects in them.
+
+        Each object is grouped in the cell containing its topleft,
+        in a table of cells of given size whose topleft is the
+        given origin. Cells are (column, row) pairs.
+        """
+        origin_x, origin_y = origin
+        cell_width, cell_height = cell_size
+
+        cell_objs = {}
+
+        xs = self.xs
+        ys = self.ys
+
+        for obj_id in self.iter_ids():
+
+            cell = (
+                (xs[obj_id] - origin_x) // cell_width,
+                (ys[obj_id] - origin_y) // cell_height,
+            )
+
+            try:
+                cell_objs[cell].add(obj_id)
+            except KeyError:
+                cell_objs[cell] = {obj_id}
+
+        return cell_objs
+
+    def get_record(self, obj_id):
+        """Return object data as (asset_id, has_size, x, y, width, height).
+
+        Where x and y are the position of the object's anchor and the
+        width and height are zero if the object has no size of its own.
+        This is the format of records in binary level files.
+        """
+        if self.sized[obj_id]:
+            width, height = self.widths[obj_id], self.heights[obj_id]
+        else:
+            width = height = 0
+
+        return (
+            self.assets[obj_id],
+            self.sized[obj_id],
+            *self.get_pos(obj_id),
+            width,
+            height,
+        )
+
+    def get_layered_objects(self):
+        """Return objects as layered objects as stored in level files."""
+
+        layered_objects = {}
+
+        layer_names = self.layer_names
+        get_obj_data = self.get_obj_data
+
+        for obj_id in self.iter_ids():
+
+            (
+                layered_objects
+                .setdefault(layer_names[self.layers[obj_id]], [])
+                .append(get_obj_data(obj_id))
+            )
+
+        return layered_objects
@@ -0,0 +1,233 @@
+"""Facility for writing PNG images incrementally, row by row.
+
+Useful for saving images too big to be kept in memory at once, since
+only the rows being written and the compressed data not yet written to
+the file are kept in memory.
+
+Rows can also be compressed beforehand, with compress_rows(), which
+returns a segment that can be written in any image with the same width,
+possibly much later. This allows compressed rows to be cached and
+reused or to be compressed in parallel.
+"""
+
+### standard library imports
+
+from struct import pack
+
+from zlib import compressobj, crc32, adler32, DEFLATED, Z_FULL_FLUSH
+
+
+
+SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+### minimum size of the IDAT chunks written (except the last one)
+IDAT_SIZE = 64 * 1024
+
+### the image data is a single zlib stream, that is, a header, deflate
+### data and the adler-32 checksum of the uncompressed data; we write
+### the deflate data in segments (see compress_rows()), so we write the
+### header and the end of the deflate data (an empty final block)
+### ourselves
+
+ZLIB_HEADER = b'\x78\x9c'
+DEFLATE_END = b'\x03\x00'
+
+ADLER_BASE = 65521
+
+
+def compress_rows(data, row_size, compression_level=6):
+    """Return segment with rows of RGB pixel data compressed.
+
+    data
+        Bytes-like object with one or more whole rows of pixels,
+        3 bytes per pixel.
+    row_size
+        Integer, number of bytes in each row (3 times the image width).
+
+    The segment is a (compressed, checksum, length) tuple: deflate data
+    independent of any data before it, the adler-32 checksum and length
+    of the data it holds once decompressed.
+    """
+    if len(data) % row_size:
+        raise ValueError("Data must contain whole rows of pixels.")
+
+    data = memoryview(data)
+
+    ### the compressor writes raw deflate data (without zlib header and
+    ### checksum), which, being flushed with Z_FULL_FLUSH, ends at a
+    ### byte boundary and doesn't reference data from other segments
+
+    compressor = compressobj(compression_level, DEFLATED, -15)
+    compress = compressor.compress
+
+    parts = []
+    checksum = 1
+
+    ### each row is preceded by its filter type (0, that is, none)
+
+    for start in range(0, len(data), row_size):
+
+        row = data[start:start+row_size]
+
+        parts.append(compress(b'\x00'))
+        parts.append(compress(row))
+
+        checksum = adler32(row, adler32(b'\x00', checksum))
+
+    parts.append(compressor.flush(Z_FULL_FLUSH))
+
+    return (
+        b''.join(parts),
+        checksum,
+        len(data) + len(data) // row_size,
+    )
+
+
+def combine_adler32(checksum1, checksum2, length2):
+    """Return adler-32 checksum of two pieces of data concatenated.
+
+    Given the checksums of both and the length of the second one (this
+    is what zlib's adler32_combine() does, which isn't exposed in the
+    zlib module).
+    """
+    remainder = length2 % ADLER_BASE
+
+    sum1 = checksum1 & 0xffff
+    sum2 = (remainder * sum1) % ADLER_BASE
+
+    sum1 = (sum1 + (checksum2 & 0xffff) + ADLER_BASE - 1) % ADLER_BASE
+
+    sum2 = (
+        sum2
+        + (checksum1 >> 16)
+        + (checksum2 >> 16)
+        + ADLER_BASE
+        - remainder
+    ) % ADLER_BASE
+
+    return sum1 | (sum2 << 16)
+
+
+class PNGWriter:
+    """Writer of 8-bit RGB PNG images, fed with rows from top to bottom.
+
+    Use it as a context manager or call close() once all rows are
+    written.
+    """
+
+    def __init__(self, filepath, width, height, compression_level=6):
+
+        self.width = width
+        self.height = height
+
+        self.row_size = width * 3
+        self.rows_written = 0
+
+        self.compression_level = compression_level
+
+        ### checksum of data written so far
+        self.checksum = 1
+
+        ### compressed data not written yet
+        self.pending = [ZLIB_HEADER]
+        self.pending_size = len(ZLIB_HEADER)
+
+        ### write signature and header
+
+        self.file = open(str(filepath), mode='wb')
+
+        self.file.write(SIGNATURE)
+
+        ## header data is the width, height, bit depth, color type (2,
+        ## that is, RGB) and the compression, filter and interlace methods
+        self.write_chunk(
+            b'IHDR',
+            pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0),
+        )
+
+    def write_chunk(self, chunk_type, data):
+
+        self.file.write(
+            pack('>I', len(data))
+            + chunk_type
+            + data
+            + pack('>I', crc32(data, crc32(chunk_type)))
+        )
+
+    def write_rows(self, data):
+        """Write rows of RGB pixel data.
+
+        data
+            Bytes-like object with one or more whole rows of pixels,
+            3 bytes per pixel.
+        """
+        self.write_segment(
+            compress_rows(data, self.row_size, self.compression_level)
+        )
+
+    def write_segment(self, segment):
+        """Write rows compressed with compress_rows().
+
+        The rows must have been compressed with the same row size.
+        """
+        compressed, checksum, length = segment
+
+        row_count = length // (self.row_size + 1)
+
+        if self.rows_written + row_count > self.height:
+            raise ValueError("Data has more rows than the image.")
+
+        self.checksum = combine_adler32(self.checksum, checksum, length)
+        self.add_compressed(compressed)
+
+        self.rows_written += row_count
+
+    def add_compressed(self, data):
+        """Store compressed data, writing it once there's enough of it."""
+
+        if not data:
+            return
+
+        self.pending.append(data)
+        self.pending_size += len(data)
+
+        if self.pending_size >= IDAT_SIZE:
+            self.write_pending()
+
+    def write_pending(self):
+
+        self.write_chunk(b'IDAT', b''.join(self.pending))
+
+        self.pending.clear()
+        self.pending_size = 0
+
+    def close(self):
+        """Finish writing image and close file."""
+
+        if self.rows_written != self.height:
+
+            self.file.close()
+            raise ValueError("Not all rows of the image were written.")
+
+        self.add_compressed(DEFLATE_END + pack('>I', self.checksum))
+
+        if self.pending:
+            self.write_pending()
+
+        self.write_chunk(b'IEND', b'')
+
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *_):
+
+        ### if an error happened, just close the file, which will be
+        ### incomplete
+
+        if exc_type is None:
+            self.close()
+
+        else:
+            self.file.close()
@@ -1,14 +1,43 @@
-"""Facility for python literal loading/saving."""
+"""Facility for python literal loading/saving.
+
+Loading can optionally use a cache beside the file (with the same name
+plus the .cache suffix) holding the parsed literal encoded with the
+marshal module, which is much faster to load than parsing the literal.
+
+The cache is keyed by the size, modification time and hash of the file.
+If the size or modification time differ, the hash is checked, so the
+cache is only considered stale if the contents of the file changed.
+"""
 
 ### standard library imports
 
 from ast import literal_eval
 
-from pprint import pformat
+from pathlib import Path
+
+from hashlib import sha1
+
+from time import perf_counter
+
+import marshal
+
+
+### version of the cache format, stored in caches so that caches with
+### a different format are considered stale
+CACHE_VERSION = 1
+
+CACHE_SUFFIX = '.cache'
 
 
-def load_pyl(filepath):
-    """Return python literal from file in filepath."""
+def load_pyl(filepath, *, use_cache=False):
+    """Return python literal from file in filepath.
+
+    If use_cache is True, the literal is loaded from its cache if it is
+    valid, otherwise it is parsed and cached. Either way, a report of
+    whether the cache was used and the time saved is printed.
+    """
+    if use_cache:
+        return load_pyl_with_cache(Path(filepath))
 
     with open(str(filepath), mode="r", encoding="utf-8") as f:
 
@@ -22,6 +51,158 @@ def load_pyl(filepath):
             raise Exception(message) from err
 
 
+def get_cache_path(filepath):
+    """Return path of cache of python literal file."""
+
+    filepath = Path(filepath)
+    return filepath.with_name(filepath.name + CACHE_SUFFIX)
+
+
+def load_pyl_with_cache(filepath):
+    """Return python literal from file, using cache beside it."""
+
+    start = perf_counter()
+
+    stat = filepath.stat()
+
+    ### try loading from cache
+
+    cache_path = get_cache_path(filepath)
+
+    try:
+        (
+            version,
+            size,
+            mtime_ns,
+            digest,
+            parse_time,
+            python_literal,
+        ) = marshal.loads(cache_path.read_bytes())
+
+    except (OSError, EOFError, ValueError, TypeError):
+        version = None
+
+    data = None
+
+    if version == CACHE_VERSION and size == stat.st_size:
+
+        ## if only the modification time changed, the cache is still
+        ## valid if the contents are the same, in which case we update
+        ## its key
+
+        if mtime_ns != stat.st_mtime_ns:
+
+            data = filepath.read_bytes()
+
+            if sha1(data).hexdigest() == digest:
+
+                write_cache(
+                    cache_path,
+                    stat,
+                    digest,
+                    parse_time,
+                    python_literal,
+                )
+
+                mtime_ns = stat.st_mtime_ns
+
+        if mtime_ns == stat.st_mtime_ns:
+
+            load_time = perf_counter() - start
+
+            report = (
+                f"Loaded {filepath.name} from cache"
+                f" in {load_time * 1000:.1f} ms"
+            )
+
+            if parse_time is not None:
+
+                report += (
+                    f", saving {(parse_time - load_time) * 1000:.1f} ms"
+                    " of parsing"
+                )
+
+            print(report + '.')
+
+            return python_literal
+
+    ### otherwise parse file and cache the literal
+
+    if data is None:
+        data = filepath.read_bytes()
+
+    try:
+        python_literal = literal_eval(data.decode('utf-8'))
+
+    except Exception as err:
+
+        message = f"Error while trying to load {filepath}."
+
+        raise Exception(message) from err
+
+    parse_time = perf_counter() - start
+
+    write_cache(
+        cache_path,
+        stat,
+        sha1(data).hexdigest(),
+        parse_time,
+        python_literal,
+    )
+
+    print(
+        f"Parsed {filepath.name} in {parse_time * 1000:.1f} ms"
+        " (cache missing or stale, cached it for next time)."
+    )
+
+    return python_literal
+
+
+def save_pyl_cache(python_literal, filepath, cache_path=None):
+    """Cache python literal saved in filepath.
+
+    The cache is saved beside the file, unless another cache_path is
+    given, for instance when the file is a temporary one about to
+    replace another file, whose cache is the one we want to write.
+    The modification time of the file is kept when it is moved, so
+    the cache remains valid.
+
+    Since the file isn't parsed, the time parsing it would take is
+    unknown, so it isn't reported when the cache is used.
+    """
+    filepath = Path(filepath)
+
+    write_cache(
+        get_cache_path(filepath) if cache_path is None else cache_path,
+        filepath.stat(),
+        sha1(filepath.read_bytes()).hexdigest(),
+        None,
+        python_literal,
+    )
+
+
+def write_cache(cache_path, stat, digest, parse_time, python_literal):
+    """Write cache, ignoring failures since the cache is optional."""
+
+    try:
+
+        cache_path.write_bytes(
+            marshal.dumps(
+                (
+                    CACHE_VERSION,
+                    stat.st_size,
+                    stat.st_mtime_ns,
+                    digest,
+                    parse_time,
+                    python_literal,
+                )
+            )
+        )
+
+    except (OSError, ValueError):
+        pass
+
+
 def save_pyl(
     python_literal,
     filepath,
@@ -30,6 +211,7 @@ def save_pyl(
     width=80,
 ):
     """Save pretty-formatted python literal in filepath."""
+    from pprint import pformat
 
     with open(str(filepath), mode="w", encoding="utf-8") as f:
 
@@ -0,0 +1,208 @@
+"""Facility for writing deep zoom image pyramids incrementally.
+
+A deep zoom image, the format read by zoomable image viewers like
+OpenSeadragon, is a small manifest (a .dzi file) plus a folder with
+one subfolder for each level of the pyramid. Levels are numbered from 0
+(a 1x1 image) to the last level (the full size image), each level being
+half the size of the next one (rounded up). Each level is cut into
+square tiles, saved as <column>_<row>.png files.
+
+The writer is fed with rows of the full size image from top to bottom
+and only keeps a band of rows as tall as a tile for each level, so the
+memory used is bounded by the width of the image rather than its area.
+"""
+
+### standard library imports
+
+from math import ceil, log2
+
+from pathlib import Path
+
+from shutil import rmtree
+
+
+### third-party imports
+
+from pygame import Surface
+
+from pygame.image import save as save_image
+
+from pygame.transform import smoothscale
+
+
+
+TILE_SIZE = 256
+
+MANIFEST = """<?xml version="1.0" encoding="UTF-8"?>
+<Image xmlns="http://schemas.microsoft.com/deepzoom/2008"
+  Format="png" Overlap="0" TileSize="{tile_size}">
+  <Size Width="{width}" Height="{height}"/>
+</Image>
+"""
+
+
+class PyramidLevel:
+    """Band of rows of a pyramid level waiting to be cut into tiles."""
+
+    def __init__(self, dirpath, width):
+
+        self.dirpath = dirpath
+        self.dirpath.mkdir(parents=True)
+
+        self.width = width
+
+        ### the band has an extra column, so an odd width can be padded
+        ### when the band is halved
+        self.band = Surface((width + 1, TILE_SIZE), 0, 32)
+
+        ### number of rows in the band and number of bands written
+        self.filled = 0
+        self.row = 0
+
+
+class PyramidWriter:
+    """Writer of deep zoom images, fed with rows from top to bottom.
+
+    Call close() once all rows are written, to write the remaining tiles
+    and the manifest.
+    """
+
+    def __init__(self, manifest_path, width, height):
+
+        self.manifest_path = Path(manifest_path)
+
+        self.width = width
+        self.height = height
+
+        self.rows_written = 0
+
+        ### tiles are saved in a folder beside the manifest, replacing
+        ### the one from a previous pyramid, if any
+
+        files_dir = self.manifest_path.with_name(
+            self.manifest_path.stem + '_files'
+        )
+
+        if files_dir.exists():
+            rmtree(files_dir)
+
+        ### create levels, from the last one (full size) to the first
+
+        last_level = ceil(log2(max(width, height, 1)))
+
+        self.levels = []
+
+        for level_number in range(last_level, -1, -1):
+
+            self.levels.append(
+                PyramidLevel(files_dir / str(level_number), width)
+            )
+
+            width = (width + 1) // 2
+
+    def write_rows(self, surf):
+        """Write rows of full size image in surf."""
+
+        height = surf.get_height()
+
+        if self.rows_written + height > self.height:
+            raise ValueError("Surface has more rows than the image.")
+
+        self.add_rows(0, surf)
+        self.rows_written += height
+
+    def add_rows(self, index, surf):
+        """Add rows in surf to band of level, writing it whenever full."""
+
+        level = self.levels[index]
+
+        band = level.band
+        width = level.width
+
+        y = 0
+        height = surf.get_height()
+
+        while y < height:
+
+            count = min(TILE_SIZE - level.filled, height - y)
+
+            band.blit(surf, (0, level.filled), (0, y, width, count))
+
+            level.filled += count
+            y += count
+
+            if level.filled == TILE_SIZE:
+                self.write_band(index)
+
+    def write_band(self, index):
+        """Cut band of level into tiles and add it halved to next level."""
+
+        level = self.levels[index]
+
+        rows = level.filled
+
+        if not rows:
+            return
+
+        band = level.band
+        width = level.width
+
+        ### save tiles
+
+        for col in range(ceil(width / TILE_SIZE)):
+
+            left = col * TILE_SIZE
+
+            save_image(
+                band.subsurface(
+                    (left, 0, min(TILE_SIZE, width - left), rows)
+                ),
+                str(level.dirpath / f'{col}_{level.row}.png'),
+            )
+
+        ### halve band and add it to the next level, if any; odd sizes
+        ### are padded by repeating the last column/row, so each pixel of
+        ### the next level is the average of exactly 2x2 pixels
+
+        if index + 1 < len(self.levels):
+
+            if width % 2:
+                band.blit(band, (width, 0), (width - 1, 0, 1, rows))
+
+            if rows % 2:
+                band.blit(band, (0, rows), (0, rows - 1, width + 1, 1))
+
+            self.add_rows(
+                index + 1,
+                smoothscale(
+                    band.subsurface(
+                        (0, 0, width + width % 2, rows + rows % 2)
+                    ),
+                    ((width + 1) // 2, (rows + 1) // 2),
+                ),
+            )
+
+        level.filled = 0
+        level.row += 1
+
+    def close(self):
+        """Write remaining tiles and the manifest."""
+
+        if self.rows_written != self.height:
+            raise ValueError("Not all rows of the image were written.")
+
+        ### write bands of each level, from the last one to the first,
+        ### since writing a band adds rows to the band of the smaller
+        ### level
+
+        for index in range(len(self.levels)):
+            self.write_band(index)
+
+        self.manifest_path.write_text(
+            MANIFEST.format(
+                tile_size=TILE_SIZE,
+                width=self.width,
+                height=self.height,
+            ),
+            encoding='utf-8',
+        )
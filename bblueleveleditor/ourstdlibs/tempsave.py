@@ -0,0 +1,41 @@
+"""Facility for saving files through temporary files.
+
+Files are first saved with a temporary name in the same folder and
+then moved over the existing file in a single step, so a file that
+gets interrupted while being saved is never left partially written
+under its final name.
+"""
+
+### standard library import
+from os import replace
+
+
+
+### prefix of temporary names; pygame picks the format of an image from
+### the suffix of its name, so a prefix is used instead
+TEMP_PREFIX = 'temp_'
+
+
+def get_temp_path(path):
+    """Return path of temporary file used to save file in path."""
+    return path.with_name(TEMP_PREFIX + path.name)
+
+
+def save_image_through_temp(surf, path):
+    """Save surf as image in path."""
+
+    from pygame.image import save as save_image
+
+    temp_path = get_temp_path(path)
+
+    save_image(surf, str(temp_path))
+    replace(temp_path, path)
+
+
+def write_bytes_through_temp(path, data):
+    """Write bytes in data to file in path."""
+
+    temp_path = get_temp_path(path)
+
+    temp_path.write_bytes(data)
+    replace(temp_path, path)
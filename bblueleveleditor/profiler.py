@@ -0,0 +1,195 @@
+"""Facility for profiling the phases of each frame of the app.
+
+Phases are functions wrapped with FrameProfiler.timed(), which adds
+the time spent in them to the current frame while the profiler is
+enabled (while disabled, the wrapped functions are just called). Since
+phases can call other phases, the time of a phase includes the time of
+the phases it calls.
+
+Calls of functions wrapped with FrameProfiler.counted() are also
+counted in each frame.
+"""
+
+### standard library imports
+
+from collections import deque
+
+from csv import writer as get_csv_writer
+
+from functools import wraps
+
+from statistics import mean
+
+from time import perf_counter
+
+
+
+class FrameProfiler:
+    """Collector of per-frame samples of times of phases and counters.
+
+    Once enabled, end_frame() must be called at the end of each frame
+    to store its sample. The most recent samples are kept to provide
+    averages and, optionally, all samples are written to a CSV file.
+    """
+
+    def __init__(self, kept_sample_count=30):
+
+        self.is_enabled = False
+
+        ### time spent in each phase and calls counted in current frame
+        self.times = {}
+        self.counters = {}
+
+        ### names of phases running, so a phase calling itself (or
+        ### another function timed as the same phase) isn't timed twice
+        self.running_phases = set()
+
+        ### most recent samples
+        self.samples = deque(maxlen=kept_sample_count)
+
+        self.frame_index = 0
+        self.frame_start = 0.0
+
+        self.csv_file = None
+        self.csv_writer = None
+
+    def timed(self, phase_name, func=None):
+        """Return func wrapped to time it as a phase with given name.
+
+        If func isn't given, a decorator is returned instead.
+        """
+        if func is None:
+            return lambda func: self.timed(phase_name, func)
+
+        times = self.times
+        times.setdefault(phase_name, 0.0)
+
+        running_phases = self.running_phases
+
+        @wraps(func)
+        def timed_func(*args, **kwargs):
+
+            if not self.is_enabled or phase_name in running_phases:
+                return func(*args, **kwargs)
+
+            running_phases.add(phase_name)
+            start = perf_counter()
+
+            try:
+                return func(*args, **kwargs)
+
+            finally:
+
+                times[phase_name] += perf_counter() - start
+                running_phases.remove(phase_name)
+
+        return timed_func
+
+    def counted(self, counter_name, func):
+        """Return func wrapped to count its calls under given name."""
+
+        counters = self.counters
+        counters.setdefault(counter_name, 0)
+
+        @wraps(func)
+        def counted_func(*args, **kwargs):
+
+            if self.is_enabled:
+                counters[counter_name] += 1
+
+            return func(*args, **kwargs)
+
+        return counted_func
+
+    def enable(self, csv_path=None):
+        """Start profiling, writing samples to csv_path if given."""
+
+        self.is_enabled = True
+
+        self.samples.clear()
+        self.reset_frame()
+
+        self.frame_index = 0
+        self.frame_start = perf_counter()
+
+        if csv_path is not None:
+
+            self.csv_file = open(
+                str(csv_path),
+                mode='w',
+                encoding='utf-8',
+                newline='',
+            )
+
+            self.csv_writer = get_csv_writer(self.csv_file)
+
+    def disable(self):
+        """Stop profiling, closing the CSV file, if any."""
+
+        self.is_enabled = False
+
+        if self.csv_file is not None:
+
+            self.csv_file.close()
+            self.csv_file = self.csv_writer = None
+
+    def reset_frame(self):
+
+        for name in self.times:
+            self.times[name] = 0.0
+
+        for name in self.counters:
+            self.counters[name] = 0
+
+    def end_frame(self, **gauges):
+        """Store sample of frame and start a new one.
+
+        gauges
+            Values measured at the end of the frame, stored in the
+            sample along with the times of phases (in milliseconds) and
+            counters.
+        """
+        now = perf_counter()
+
+        sample = {
+            'frame': self.frame_index,
+            'frame_ms': (now - self.frame_start) * 1000,
+        }
+
+        for name, time in self.times.items():
+            sample[name + '_ms'] = time * 1000
+
+        sample.update(self.counters)
+        sample.update(gauges)
+
+        self.samples.append(sample)
+
+        if self.csv_file is not None:
+
+            if not self.frame_index:
+                self.csv_writer.writerow(sample)
+
+            self.csv_writer.writerow(
+                [
+                    format(value, '.3f') if type(value) is float else value
+                    for value in sample.values()
+                ]
+            )
+
+        self.reset_frame()
+
+        self.frame_index += 1
+        self.frame_start = now
+
+    def get_means(self):
+        """Return map of each item of the samples to its mean value."""
+
+        samples = self.samples
+
+        if not samples:
+            return {}
+
+        return {
+            key: mean(sample[key] for sample in samples)
+            for key in samples[-1]
+        }
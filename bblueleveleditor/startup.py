@@ -0,0 +1,170 @@
+"""Facility for reporting where the startup time of the app goes.
+
+The app and the modules it depends on are imported in a new process
+run with Python's -X importtime option, so the import time of each
+module is reported on its stderr. The report lists, for the modules
+imported directly by the app, the time taken to import each of them
+(including the modules they import in turn), followed by the time taken
+by each step of the app's own setup (stored in app.STARTUP_TIMES).
+
+The headless core of the editor (the level module) is also imported
+alone in another process, to show it doesn't depend on the display.
+
+From the command line:
+
+    python -m bblueleveleditor --startup-times
+"""
+
+### standard library imports
+
+import os, sys
+
+from ast import literal_eval
+
+from subprocess import run
+
+
+
+### number of modules listed in the report, from the slowest one
+LISTED_MODULE_COUNT = 12
+
+APP_MODULE = 'bblueleveleditor.app'
+CORE_MODULE = 'bblueleveleditor.level'
+
+
+def get_import_times(module_name, code=''):
+    """Return times of imports in a new process and its stdout.
+
+    Times are a list of (depth, self ms, cumulative ms, module name)
+    tuples, in the order reported by Python, that is, each module comes
+    after the modules it imports.
+    """
+    env = dict(os.environ, SDL_VIDEODRIVER='dummy')
+
+    completed = run(
+        [
+            sys.executable,
+            '-X',
+            'importtime',
+            '-c',
+            f'import {module_name}\n{code}',
+        ],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+
+    if completed.returncode:
+
+        sys.stderr.write(completed.stderr)
+        raise RuntimeError(f"Couldn't import {module_name}.")
+
+    times = []
+
+    for line in completed.stderr.splitlines():
+
+        if not line.startswith('import time:'):
+            continue
+
+        self_us, cumulative_us, name = line[12:].split('|')
+
+        if not self_us.strip().isdigit():
+            continue
+
+        ## nested imports are indented by two spaces per level
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+
+        times.append(
+            (
+                depth,
+                int(self_us) / 1000,
+                int(cumulative_us) / 1000,
+                name.strip(),
+            )
+        )
+
+    return times, completed.stdout
+
+
+def get_direct_import_times(times, module_name):
+    """Return times of modules imported directly by given module.
+
+    Returns a list of (cumulative ms, module name) tuples plus the self
+    time of the given module.
+    """
+    module_index, module_depth = next(
+        (index, depth)
+        for index, (depth, _, _, name) in enumerate(times)
+        if name == module_name
+    )
+
+    direct_times = []
+
+    ## the modules imported by the given one are the ones listed right
+    ## before it with greater depth
+    for depth, _, cumulative_ms, name in reversed(times[:module_index]):
+
+        if depth <= module_depth:
+            break
+
+        if depth == module_depth + 1:
+            direct_times.append((cumulative_ms, name))
+
+    return direct_times, times[module_index][1]
+
+
+def report_startup_times():
+    """Print breakdown of time taken to import/set up app and core."""
+
+    times, stdout = get_import_times(
+        APP_MODULE,
+        'print(repr(bblueleveleditor.app.STARTUP_TIMES))',
+    )
+
+    step_times = literal_eval(stdout.strip().splitlines()[-1])
+
+    total_ms = sum(
+        cumulative_ms
+        for depth, _, cumulative_ms, _ in times
+        if depth == 0
+    )
+
+    print(f"Importing {APP_MODULE} took {total_ms:.1f} ms in total.")
+
+    ###
+
+    direct_times, app_self_ms = get_direct_import_times(times, APP_MODULE)
+
+    direct_times.sort(reverse=True)
+
+    print(f"\nModules imported by {APP_MODULE} (cumulative):")
+
+    for cumulative_ms, name in direct_times[:LISTED_MODULE_COUNT]:
+        print(f"  {cumulative_ms:9.1f} ms  {name}")
+
+    ###
+
+    print(f"\nSetup of {APP_MODULE} itself ({app_self_ms:.1f} ms):")
+
+    for step_name, step_ms in step_times.items():
+        print(f"  {step_ms:9.1f} ms  {step_name}")
+
+    ###
+
+    core_times, _ = get_import_times(CORE_MODULE)
+
+    core_ms = sum(
+        cumulative_ms
+        for depth, _, cumulative_ms, _ in core_times
+        if depth == 0
+    )
+
+    imports_pygame = any(
+        name == 'pygame'
+        for _, _, _, name in core_times
+    )
+
+    print(
+        f"\nImporting {CORE_MODULE} alone took {core_ms:.1f} ms"
+        + (" (pygame included)." if imports_pygame else " (no pygame).")
+    )